@@ -0,0 +1,218 @@
+"""End-to-end load benchmark for the handlers.
+
+Drives `bot.handlers.handle_ai` and the other handlers at a fixed concurrency
+against a temporary SQLite database, an in-process Redis stand-in (fakeredis)
+and the local OpenRouter mock, then reports latency percentiles and throughput:
+
+    python -m benchmarks.bench_handlers --concurrency 32 --requests 2000 --stream
+
+Generations are queued per model like in the bot, and the config only lets 4 of
+them run at once, so with the mock's default latency `ai` tops out at a few
+requests per second whatever `--concurrency` is. Raise `--model-concurrency`
+to load the rest of the pipeline instead of the queue.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from fakeredis import TcpFakeServer
+from loguru import logger
+
+import benchmarks.placeholder_env  # noqa: F401
+from benchmarks.mock_openrouter import add_mock_arguments, config_from_args, start_server
+
+# How often each handler is called, roughly like in production
+SCENARIOS = {
+    "ai": 0.7,
+    "settings": 0.1,
+    "mood_page": 0.1,
+    "models_list": 0.1,
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_redis_stand_in() -> TcpFakeServer:
+    """Starts fakeredis' TCP server in a thread, so the bot talks to it like to Redis."""
+    server = TcpFakeServer(("127.0.0.1", free_port()), server_type="redis")
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(latencies: list[float], q: int) -> float:
+    if len(latencies) < 2:
+        return latencies[0] if latencies else 0.0
+    return statistics.quantiles(latencies, n=100, method="inclusive")[q - 1]
+
+
+async def run(args: argparse.Namespace) -> None:
+    redis_server = start_redis_stand_in()
+    db_path = Path(tempfile.mkdtemp()) / "bench.db"
+
+    mock_runner, base_url = await start_server(config_from_args(args), port=args.mock_port)
+
+    # The bot reads its settings on import, so everything has to be set before that
+    os.environ.update(
+        OPENAI_BASE_URL=args.base_url or base_url,
+        REDIS_HOST="127.0.0.1",
+        REDIS_PORT=str(redis_server.server_address[1]),
+        DB_PATH=str(db_path),
+    )
+    from bot import handlers
+    from bot.cache.redis import cache_stats
+    from bot.base import UserInfo
+    from bot.core.config import settings
+    from bot.core.loader import openrouter_client, redis_client
+    from bot.database.database import engine, read_engine, sessionmaker
+    from bot.database.models import Base
+    from bot.generation.ratelimit import rate_limiter
+    from bot.generation.scheduler import scheduler
+    from bot.generation.writer import generation_writer
+    from bot.services.moods import add_default_mood
+    from bot.services.users import add_user
+
+    # Telegrinder replaces the log handlers when it's imported
+    set_log_level(args.log_level)
+    if args.model_concurrency is not None:
+        settings.generation_queue.max_concurrency = args.model_concurrency
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with sessionmaker() as session:
+        for user_id in range(1, args.users + 1):
+            await add_user(session, user_id, "vk")
+        await add_default_mood(session, int(settings.VK_ADMIN_ID))
+
+    # Limits would turn most of the load away, only measure them when asked to
+    settings.rate_limit.enabled = args.rate_limit
+    await rate_limiter.load()
+    await openrouter_client.start()
+
+    rng = random.Random(0)
+    names = list(SCENARIOS)
+    weights = list(SCENARIOS.values())
+
+    async def call(scenario: str) -> str:
+        user_id = rng.randint(1, args.users)
+        match scenario:
+            case "ai":
+                reply = await handlers.handle_ai(
+                    "расскажи анекдот", UserInfo(user_id, "Bench User"), settings.VK_GROUP_ID, "vk",
+                    on_partial=(lambda _: None) if args.stream else None,
+                    chat_id=rng.randint(1, args.chats),
+                )
+            case "settings":
+                reply = (await handlers.handle_settings(user_id))[0]
+            case "mood_page":
+                result = await handlers.handle_mood_page(platform="vk")
+                reply = result if isinstance(result, str) else result[0]
+            case _:
+                reply = await handlers.handle_models_list()
+        return reply
+
+    latencies: dict[str, list[float]] = defaultdict(list)
+    system_replies: dict[str, int] = defaultdict(int)
+    errors: dict[str, int] = defaultdict(int)
+    queue: asyncio.Queue[str] = asyncio.Queue()
+    for _ in range(args.requests):
+        queue.put_nowait(rng.choices(names, weights)[0])
+
+    async def worker() -> None:
+        while not queue.empty():
+            scenario = queue.get_nowait()
+            started_at = time.perf_counter()
+            try:
+                reply = await call(scenario)
+            except Exception as e:
+                errors[scenario] += 1
+                if errors[scenario] == 1:
+                    print(f"{scenario} failed: {e!r}")
+                continue
+            latencies[scenario].append(time.perf_counter() - started_at)
+            if scenario == "ai" and reply.startswith(settings.emojis.system):
+                # Errors, full queues and open circuit breakers are answered with system messages
+                system_replies[scenario] += 1
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started_at
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, {elapsed:.2f}s, {args.requests / elapsed:.1f} req/s")
+    print(f"{'handler':<12} {'count':>6} {'p50, ms':>9} {'p95, ms':>9} {'p99, ms':>9} {'system':>7} {'errors':>7}")
+    for scenario in names:
+        values = latencies[scenario]
+        print(
+            f"{scenario:<12} {len(values):>6}"
+            f" {percentile(values, 50) * 1000:>9.1f}"
+            f" {percentile(values, 95) * 1000:>9.1f}"
+            f" {percentile(values, 99) * 1000:>9.1f}"
+            f" {system_replies[scenario]:>7} {errors[scenario]:>7}"
+        )
+    print(f"HTTP pool: {openrouter_client.stats}")
+    for model_name, stats in scheduler.stats().items():
+        print(f"Queue {model_name}: {stats}, avg wait {stats.avg_wait * 1000:.1f}ms")
+
+    for name, stats in sorted(cache_stats.items()):
+        if not stats.calls:
+            continue
+        print(
+            f"Cache {name}: {stats.local_hit_rate:.0%} in-process,"
+            f" {stats.redis_hit_rate:.0%} of the rest from Redis, {stats}"
+        )
+
+    await generation_writer.close()
+    print(f"Generation writer: {generation_writer.stats}, {generation_writer.stats.avg_batch:.1f} per batch")
+    await openrouter_client.close()
+    await engine.dispose()
+    if read_engine is not None:
+        await read_engine.dispose()
+    await mock_runner.cleanup()
+    await redis_client.aclose()
+    redis_server.shutdown()
+
+
+def set_log_level(level: str) -> None:
+    logger.remove()
+    logger.add(sys.stderr, level=level)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--stream", action="store_true", help="stream responses like the VK/TG handlers do")
+    parser.add_argument("--rate-limit", action="store_true", help="keep the per-user and per-chat limits on")
+    parser.add_argument("--base-url", help="use an already running mock instead of starting one")
+    parser.add_argument("--mock-port", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING", help="the bot logs every prompt on INFO")
+    parser.add_argument(
+        "--model-concurrency", type=int, help="generations of a model run at once, 4 in the config"
+    )
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    set_log_level(args.log_level)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
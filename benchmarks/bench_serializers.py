@@ -0,0 +1,88 @@
+"""Compares pickle with the record serializer on the values the bot actually caches.
+
+Run from the repository root: python -m benchmarks.bench_serializers
+"""
+import datetime
+import random
+import timeit
+
+import benchmarks.placeholder_env  # noqa: F401
+from bot.cache.serialization import PickleSerializer, RecordSerializer
+from bot.core.config import settings
+from bot.database.models import MoodModel, UserModel
+from bot.services.users import UserContext
+
+NUMBER = 2000
+
+
+def make_mood(mood_id: int) -> MoodModel:
+    return MoodModel(
+        id=mood_id,
+        user_id=random.randint(10**8, 10**9),
+        name=f"Настроение {mood_id}",
+        description="Отвечает как пират и постоянно вспоминает о море",
+        # Distinct strings, pickle would store one shared string only once
+        instructions=f"You are pirate #{mood_id}. Answer every question like a pirate would. " * 8,
+        is_private=False,
+        created_at=datetime.datetime(2025, 1, 1, 12, 30),
+    )
+
+
+def make_catalog(size: int = 350) -> list[dict]:
+    """Roughly the shape of OpenRouter's /models response."""
+    return [
+        {
+            "id": f"vendor-{i % 40}/model-{i}",
+            "name": f"Vendor {i % 40}: Model {i}",
+            "created": 1700000000 + i,
+            "description": f"Model {i} is a large language model tuned for chat and instruction following. " * 6,
+            "context_length": 131072,
+            "architecture": {"modality": "text->text", "tokenizer": "Other", "instruct_type": None},
+            "pricing": {"prompt": "0.0000002", "completion": "0.0000006", "request": "0", "image": "0"},
+            "top_provider": {"context_length": 131072, "max_completion_tokens": 8192, "is_moderated": False},
+            "supported_parameters": ["max_tokens", "temperature", "top_p", "stop", "seed"],
+        }
+        for i in range(size)
+    ]
+
+
+def main() -> None:
+    random.seed(0)
+    user = UserModel(
+        id=123456789, platform="vk", current_mood_id=3, current_model_id="1",
+        persona="Меня зовут Вася, я люблю котов", is_owner=False,
+        created_at=datetime.datetime(2025, 1, 1, 12, 30),
+    )
+    moods = [make_mood(i) for i in range(50)]
+    values = {
+        "get_user": user,
+        "get_mood": moods[0],
+        "get_all_moods": moods,
+        "get_all_moods (popularity)": [(mood, random.randint(0, 5000)) for mood in moods],
+        "get_user_context": UserContext(user=user, model=settings.models[0], mood=moods[3]),
+        "get_model_list": make_catalog(),
+    }
+    serializers = {
+        "pickle": PickleSerializer(),
+        "record": RecordSerializer(dataclasses=(UserContext,), compress_threshold=None),
+        "record+compress": RecordSerializer(dataclasses=(UserContext,)),
+    }
+
+    print(f"{'value':<28} {'serializer':<16} {'bytes':>9} {'dump, µs':>10} {'load, µs':>10}")
+    for name, value in values.items():
+        for serializer_name, serializer in serializers.items():
+            data = serializer.serialize(value)
+            dump = timeit.timeit(lambda: serializer.serialize(value), number=NUMBER) / NUMBER
+            load = timeit.timeit(lambda: serializer.deserialize(data), number=NUMBER) / NUMBER
+            print(
+                f"{name:<28} {serializer_name:<16} {len(data):>9}"
+                f" {dump * 1e6:>10.1f} {load * 1e6:>10.1f}"
+            )
+
+    # Sanity check: records look like the rows they came from
+    restored = serializers["record"].deserialize(serializers["record"].serialize(moods[0]))
+    assert restored.name == moods[0].name and restored.created_at == moods[0].created_at
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Compares concurrent read/write throughput of the default SQLite engine and the tuned one.
+
+Readers look up users and count their generations, writers insert one generation
+per transaction. Run from the repository root:
+
+    python -m benchmarks.bench_sqlite --readers 16 --writers 4 --seconds 10
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+import benchmarks.placeholder_env  # noqa: F401
+from bot.database.database import create_engine, get_sessionmaker
+from bot.database.models import Base, GenerationsModel, MoodModel, UserModel
+
+
+async def seed(sessionmaker: async_sessionmaker[AsyncSession], users: int, generations: int) -> None:
+    rng = random.Random(0)
+    async with sessionmaker() as session:
+        await session.execute(insert(UserModel), [{"id": i, "platform": "vk"} for i in range(1, users + 1)])
+        await session.execute(
+            insert(MoodModel),
+            [{"id": i, "user_id": 1, "name": f"mood {i}", "instructions": "..."} for i in range(10)],
+        )
+        await session.execute(
+            insert(GenerationsModel),
+            [
+                {"response": "ответ " * 50, "user_id": rng.randint(1, users), "model": "m", "mood_id": rng.randrange(10)}
+                for _ in range(generations)
+            ],
+        )
+        await session.commit()
+
+
+async def run_workload(
+    sessionmaker: async_sessionmaker[AsyncSession], args: argparse.Namespace
+) -> dict[str, int]:
+    counts = {"reads": 0, "writes": 0, "locked": 0}
+    deadline = time.monotonic() + args.seconds
+    rng = random.Random(1)
+
+    async def reader() -> None:
+        while time.monotonic() < deadline:
+            user_id = rng.randint(1, args.users)
+            async with sessionmaker() as session:
+                await session.execute(select(UserModel).filter_by(id=user_id))
+                await session.execute(
+                    select(func.count(GenerationsModel.id)).filter(GenerationsModel.user_id == user_id)
+                )
+            counts["reads"] += 1
+
+    async def writer() -> None:
+        while time.monotonic() < deadline:
+            try:
+                async with sessionmaker() as session:
+                    session.add(
+                        GenerationsModel(
+                            response="ответ " * 50, user_id=rng.randint(1, args.users),
+                            model="m", mood_id=rng.randrange(10),
+                        )
+                    )
+                    await session.commit()
+                counts["writes"] += 1
+            except OperationalError:
+                counts["locked"] += 1
+
+    await asyncio.gather(
+        *(reader() for _ in range(args.readers)), *(writer() for _ in range(args.writers))
+    )
+    return counts
+
+
+async def bench(name: str, tuned: bool, args: argparse.Namespace) -> None:
+    url = f"sqlite+aiosqlite:///{Path(tempfile.mkdtemp()) / 'bench.db'}"
+    if tuned:
+        engine = create_engine(url, pool_size=args.writers)
+        read_engine = create_engine(url, read_only=True, pool_size=args.readers)
+        engines = [engine, read_engine]
+        sessionmaker = get_sessionmaker(engine, read_engine)
+    else:
+        # What the bot used before
+        engine = create_async_engine(url)
+        engines = [engine]
+        sessionmaker = get_sessionmaker(engine)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await seed(sessionmaker, args.users, args.generations)
+
+    counts = await run_workload(sessionmaker, args)
+    print(
+        f"{name:<8} reads {counts['reads'] / args.seconds:>8.1f}/s"
+        f"  writes {counts['writes'] / args.seconds:>7.1f}/s  locked errors {counts['locked']}"
+    )
+    for engine in engines:
+        await engine.dispose()
+
+
+async def main(args: argparse.Namespace) -> None:
+    await bench("default", tuned=False, args=args)
+    await bench("tuned", tuned=True, args=args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--generations", type=int, default=50_000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,70 @@
+"""Compares rendering instruction templates from disk with the compiled template registry.
+
+Run from the repository root: python -m benchmarks.bench_templates
+"""
+import asyncio
+import time
+
+import yaml
+from jinja2.sandbox import ImmutableSandboxedEnvironment
+
+import benchmarks.placeholder_env  # noqa: F401
+from bot.base import Conversation, Message, Prompt
+from bot.templates import template_registry
+
+try:
+    import aiofiles
+except ImportError:
+    aiofiles = None
+
+NUMBER = 2000
+
+
+async def old_render(prompt: Prompt, bot_id: str, template_name: str) -> str:
+    """How `Prompt.full_render_template` worked before the registry."""
+    jinja_env = ImmutableSandboxedEnvironment(trim_blocks=True, lstrip_blocks=True)
+    rendered = prompt.full_render(bot_id)
+
+    file = template_registry.path / f"{template_name}.yaml"
+    if aiofiles is not None:
+        async with aiofiles.open(file, "r", encoding="utf-8") as f:
+            content = await f.read()
+    else:
+        content = file.read_text(encoding="utf-8")
+    data = yaml.safe_load(content)
+    instruction_template = jinja_env.from_string(data["instruction_template"])
+
+    return instruction_template.render(messages=rendered, add_generation_prompt=True)
+
+
+async def measure(render, prompt: Prompt, template_name: str) -> float:
+    start = time.perf_counter()
+    for _ in range(NUMBER):
+        await render(prompt, "1", template_name)
+    return (time.perf_counter() - start) / NUMBER
+
+
+async def main() -> None:
+    prompt = Prompt(
+        headers=[Message("You are a helpful AI assistant. " * 20)],
+        convo=Conversation(
+            [
+                Message("Привет, как дела?", "2", "Ivan Ivanov"),
+                Message("Отлично!", "-1"),
+                Message("Расскажи анекдот", "2", "Ivan Ivanov"),
+            ]
+        ),
+    )
+    names = sorted(file.stem for file in template_registry.path.glob("*.yaml"))
+    template_registry.load_all()
+
+    print(f"{'template':<16} {'old, µs':>10} {'new, µs':>10} {'speedup':>8}")
+    for name in names:
+        assert await old_render(prompt, "1", name) == await prompt.full_render_template("1", name)
+        old = await measure(old_render, prompt, name)
+        new = await measure(Prompt.full_render_template, prompt, name)
+        print(f"{name:<16} {old * 1e6:>10.1f} {new * 1e6:>10.1f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+"""Compares token counting in `moderate_query` before and after the tokenizer registry.
+
+Run from the repository root: python -m benchmarks.bench_tokenizer
+"""
+import asyncio
+import random
+import time
+
+import tiktoken
+
+import benchmarks.placeholder_env  # noqa: F401
+from bot import ai_stuff
+
+LIMIT = 4000
+WORDS = (
+    "you are a cute anime girl who always answers in russian and uses :3 a lot "
+    "ты милая девочка которая отвечает на любые вопросы и никогда не выходит из роли"
+).split()
+
+# Typical sizes of inputs we moderate, in characters
+CASES = {
+    "!ai": 200,
+    "!персона": 1_500,
+    "!создать муд": 3_000,
+    "huge persona": 20_000,
+    "spam": 200_000,
+}
+
+
+def make_text(size: int) -> str:
+    rng = random.Random(size)
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:size]
+
+
+def old_count(string: str) -> int:
+    encoding = tiktoken.encoding_for_model("gpt-4o")
+    return len(encoding.encode(string, disallowed_special=()))
+
+
+def timeit(func, *args, number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        func(*args)
+    return (time.perf_counter() - start) / number
+
+
+async def loop_block(text: str) -> float:
+    """Returns the longest time the event loop was blocked while counting."""
+    longest = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal longest
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0)
+            longest = max(longest, time.perf_counter() - start)
+
+    task = asyncio.create_task(ticker())
+    await ai_stuff.count_tokens_over_limit_async(text, LIMIT)
+    done = True
+    await task
+    return longest
+
+
+def main() -> None:
+    # Load the encoding before measuring anything
+    ai_stuff.get_encoding("gpt-4o")
+
+    print(f"{'case':<14} {'chars':>8} {'old, µs':>10} {'new, µs':>10} {'loop block, µs':>15}")
+    for name, size in CASES.items():
+        text = make_text(size)
+        number = max(10, 200_000 // size)
+        old = timeit(old_count, text, number=number)
+        new = timeit(ai_stuff.count_tokens_over_limit, text, LIMIT, number=number)
+        block = asyncio.run(loop_block(text))
+        print(f"{name:<14} {size:>8} {old * 1e6:>10.1f} {new * 1e6:>10.1f} {block * 1e6:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
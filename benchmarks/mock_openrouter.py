@@ -0,0 +1,165 @@
+"""Local stand-in for the parts of the OpenRouter API the bot uses.
+
+Serves /chat/completions (JSON and SSE streaming) and /models with configurable
+latency and errors, so OPENAI_BASE_URL can point at it instead of burning quota:
+
+    python -m benchmarks.mock_openrouter --port 8080 --latency-ms 800 --error-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8080 python -m bot.vk
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+
+import orjson
+from aiohttp import web
+
+WORDS = "ну привет это просто тестовый ответ от модели который ничего не значит".split()
+
+
+@dataclass
+class MockConfig:
+    # Time to the first token, then the rest of the tokens come every `token_ms`
+    latency_ms: float = 500
+    latency_jitter: float = 0.3
+    token_ms: float = 20
+    tokens: int = 60
+    error_rate: float = 0.0
+    error_status: int = 429
+    models: tuple[str, ...] = ()
+
+
+class MockOpenRouter:
+    def __init__(self, config: MockConfig) -> None:
+        self.config = config
+        self.requests = 0
+        self.rng = random.Random(0)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/chat/completions", self.chat_completions)
+        app.router.add_get("/models", self.models)
+        return app
+
+    def _latency(self) -> float:
+        """Log-normal time to the first token, in seconds."""
+        mean = self.config.latency_ms / 1000
+        return mean * self.rng.lognormvariate(0, self.config.latency_jitter)
+
+    def _chunk(self, model: str, delta: dict | None, usage: dict | None = None) -> bytes:
+        chunk: dict = {
+            "id": f"gen-{self.requests}",
+            "provider": "Mock",
+            "model": model,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "choices": [{"index": 0, "delta": delta or {}, "finish_reason": None if delta else "stop"}],
+        }
+        if usage is not None:
+            chunk["usage"] = usage
+        return b"data: " + orjson.dumps(chunk) + b"\n\n"
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        body = await request.json()
+        model = body.get("model", "mock/model")
+        tokens = [self.rng.choice(WORDS) + " " for _ in range(self.config.tokens)]
+        usage = {
+            "prompt_tokens": len(orjson.dumps(body.get("messages") or body.get("prompt"))) // 4,
+            "completion_tokens": len(tokens),
+            "total_tokens": 0,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        await asyncio.sleep(self._latency())
+        if self.rng.random() < self.config.error_rate:
+            return web.json_response(
+                {"error": {"code": self.config.error_status, "message": "Mock upstream error"}},
+                status=self.config.error_status,
+            )
+
+        if not body.get("stream"):
+            await asyncio.sleep(self.config.token_ms * len(tokens) / 1000)
+            return web.json_response(
+                {
+                    "id": f"gen-{self.requests}",
+                    "provider": "Mock",
+                    "model": model,
+                    "choices": [
+                        {"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}}
+                    ],
+                    "usage": usage,
+                }
+            )
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await response.write(b": OPENROUTER PROCESSING\n\n")
+        for token in tokens:
+            await response.write(self._chunk(model, {"role": "assistant", "content": token}))
+            await asyncio.sleep(self.config.token_ms / 1000)
+        await response.write(self._chunk(model, None, usage))
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def models(self, _: web.Request) -> web.Response:
+        free = {"prompt": "0", "completion": "0", "request": "0", "image": "0"}
+        paid = {"prompt": "0.000001", "completion": "0.000002", "request": "0", "image": "0"}
+        data = [
+            {
+                "id": model_id,
+                "name": model_id.split("/")[-1],
+                "context_length": 32768,
+                "pricing": free if model_id.endswith(":free") else paid,
+            }
+            for model_id in (*self.config.models, "mock/free-model:free", "mock/paid-model")
+        ]
+        return web.json_response({"data": data})
+
+
+async def start_server(config: MockConfig, host: str = "127.0.0.1", port: int = 0) -> tuple[web.AppRunner, str]:
+    """Starts the mock in the current event loop and returns its base URL."""
+    runner = web.AppRunner(MockOpenRouter(config).app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = runner.addresses[0][1]
+    return runner, f"http://{host}:{bound_port}"
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency-ms", type=float, default=500, help="mean time to the first token")
+    parser.add_argument("--latency-jitter", type=float, default=0.3, help="sigma of the log-normal latency")
+    parser.add_argument("--token-ms", type=float, default=20, help="delay between streamed tokens")
+    parser.add_argument("--tokens", type=int, default=60, help="tokens per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests that fail")
+    parser.add_argument("--error-status", type=int, default=429, help="HTTP status of failed requests")
+
+
+def config_from_args(args: argparse.Namespace, models: tuple[str, ...] = ()) -> MockConfig:
+    return MockConfig(
+        latency_ms=args.latency_ms,
+        latency_jitter=args.latency_jitter,
+        token_ms=args.token_ms,
+        tokens=args.tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        models=models,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    web.run_app(MockOpenRouter(config_from_args(args)).app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
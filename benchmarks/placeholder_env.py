@@ -0,0 +1,19 @@
+"""Lets benchmarks import the bot without a configured .env.
+
+The bot reads its settings on import and requires the API keys, so importing
+this module first fills them with placeholders, keeping the ones already set:
+
+    import benchmarks.placeholder_env  # noqa: F401
+"""
+import os
+
+PLACEHOLDERS = {
+    "VK_API_KEY": "bench",
+    "VK_GROUP_ID": "1",
+    "VK_ADMIN_ID": "1",
+    "TG_API_KEY": "1:bench",
+    "OPENAI_API_KEY": "bench",
+}
+
+for key, value in PLACEHOLDERS.items():
+    os.environ.setdefault(key, value)
@@ -0,0 +1,135 @@
+"""Checks that the hot queries are answered from indexes instead of full table scans.
+
+Migrates a fresh database to the latest schema, runs the service functions
+behind the mood list, mood info and "my moods" pages with their caches
+bypassed and the usage report, and asserts that the plans of the queries they send use the
+expected indexes. Exits with an error if one of them doesn't:
+
+    python -m benchmarks.query_plans
+    python -m benchmarks.query_plans --url postgresql+asyncpg://postgres@localhost/nedogpt_test
+
+Sequential scans are disabled on PostgreSQL, the planner rightly prefers them
+on empty tables. Only use a throwaway PostgreSQL database, it gets migrated.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import tempfile
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+from typing import Any
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+import benchmarks.placeholder_env  # noqa: F401
+
+ALEMBIC_INI = Path(__file__).parents[1] / "alembic.ini"
+
+
+async def capture_queries(
+    engine: AsyncEngine, call: Callable[[AsyncSession], Awaitable[Any]]
+) -> list[tuple[str, Any]]:
+    """Runs the call and returns the statements it sent with their parameters."""
+    from bot.database.database import get_sessionmaker
+
+    queries = []
+
+    def remember(conn, cursor, statement, parameters, context, executemany) -> None:
+        queries.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", remember)
+    try:
+        async with get_sessionmaker(engine)() as session:
+            await call(session)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", remember)
+    return queries
+
+
+async def explain(engine: AsyncEngine, statement: str, parameters: Any) -> str:
+    async with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            await conn.exec_driver_sql("SET enable_seqscan = off")
+            rows = await conn.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+            return "\n".join(row[0] for row in rows)
+        rows = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return "\n".join(row[-1] for row in rows)
+
+
+async def check(url: str) -> None:
+    from bot.database.database import create_engine
+    import datetime
+
+    from bot.services.generations import count_generations, get_usage
+    from bot.services.moods import get_all_moods, get_public_moods_page
+
+    # Cached services are called undecorated, the cache would hide the queries
+    checks: dict[str, tuple[Callable[[AsyncSession], Awaitable[Any]], str | tuple[str, ...]]] = {
+        "mood page by popularity": (
+            lambda session: get_public_moods_page(session, 16, after=(100, 42)),
+            "ix_mood_stats_generations",
+        ),
+        "previous mood page": (
+            lambda session: get_public_moods_page(session, 16, before=(100, 42)),
+            "ix_mood_stats_generations",
+        ),
+        "generations of a mood": (
+            lambda session: count_generations.__wrapped__(session, mood_id=1),
+            # The counter is looked up by its primary key, spelled differently by each database
+            ("mood_stats USING INTEGER PRIMARY KEY", "mood_stats_pkey"),
+        ),
+        "generations of a user": (
+            lambda session: count_generations.__wrapped__(session, user_id=1),
+            "ix_generations_user_id_model",
+        ),
+        "generations of a model": (
+            lambda session: count_generations.__wrapped__(session, model="openai/gpt-4o"),
+            "ix_generations_model",
+        ),
+        "usage of the last week": (
+            lambda session: get_usage(session, datetime.date(2026, 1, 1), group_by=("model",)),
+            ("sqlite_autoindex_usage_daily_1", "usage_daily_pkey"),
+        ),
+        "moods of a user": (
+            lambda session: get_all_moods.__wrapped__(session, user_id=1),
+            "ix_moods_user_id_is_private",
+        ),
+    }
+
+    engine = create_engine(url, pool_size=1)
+    failed = []
+    for name, (call, indexes) in checks.items():
+        indexes = (indexes,) if isinstance(indexes, str) else indexes
+        queries = await capture_queries(engine, call)
+        plans = [await explain(engine, statement, parameters) for statement, parameters in queries]
+        used = any(index in plan for index in indexes for plan in plans)
+        failed += [] if used else [name]
+
+        print(f"{'ok' if used else 'FAIL':<5} {name} ({' or '.join(indexes)})")
+        for plan in plans:
+            print("      " + plan.replace("\n", "\n      "))
+    await engine.dispose()
+
+    if failed:
+        raise SystemExit(f"Not using the expected indexes: {', '.join(failed)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="database to check, a temporary SQLite one by default")
+    args = parser.parse_args()
+    url = args.url or f"sqlite+aiosqlite:///{Path(tempfile.mkdtemp()) / 'plans.db'}"
+
+    config = Config(str(ALEMBIC_INI))
+    config.attributes["database_url"] = url
+    command.upgrade(config, "head")
+
+    asyncio.run(check(url))
+
+
+if __name__ == "__main__":
+    main()
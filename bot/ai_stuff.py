@@ -1,21 +1,117 @@
-import aiohttp
+import asyncio
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import orjson
 import tiktoken
 from loguru import logger
 
+from bot.core.loader import openrouter_client
+
+
+# Strings longer than this are tokenized in a thread, so they don't block the event loop
+TOKENIZE_IN_THREAD_CHARS = 4000
+
+_encodings: dict[str, tiktoken.Encoding] = {}
+_tokenizer_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tokenizer")
+
+
+def get_encoding(model: str = "gpt-4o") -> tiktoken.Encoding:
+    """Returns the tokenizer for `model`, loading it only once per process."""
+    encoding = _encodings.get(model)
+    if encoding is None:
+        encoding = tiktoken.encoding_for_model(model)
+        _encodings[model] = encoding
+    return encoding
+
 
 def num_tokens_from_string(string: str, model: str = "gpt-4o") -> int:
-    encoding = tiktoken.encoding_for_model(model)
+    encoding = get_encoding(model)
     num_tokens = len(encoding.encode(string, disallowed_special=()))
     return num_tokens
 
 
-async def create_response(
-    headers: dict,
-    url: str,
+def count_tokens_over_limit(string: str, limit: int, model: str = "gpt-4o") -> int | None:
+    """Returns None if `string` fits in `limit` tokens, otherwise how many tokens were counted.
+
+    Every token is at least one UTF-8 byte, so strings that are short enough
+    aren't tokenized at all. Long strings are tokenized by growing prefixes
+    and counting stops as soon as a prefix goes over the limit, so the returned
+    number may be lower than the real amount of tokens.
+    """
+    if len(string) * 4 <= limit or len(string.encode("utf-8")) <= limit:
+        return None
+
+    encoding = get_encoding(model)
+    size = limit * 4
+    while size < len(string):
+        # Cut on a whitespace, so the prefix is tokenized the same way as the full string
+        cut = string.rfind(" ", 0, size)
+        prefix = string[:cut] if cut > 0 else string[:size]
+        num_tokens = len(encoding.encode(prefix, disallowed_special=()))
+        if num_tokens > limit:
+            return num_tokens
+        size *= 2
+
+    num_tokens = len(encoding.encode(string, disallowed_special=()))
+    return num_tokens if num_tokens > limit else None
+
+
+async def count_tokens_over_limit_async(
+    string: str, limit: int, model: str = "gpt-4o"
+) -> int | None:
+    """Same as `count_tokens_over_limit`, but large strings are tokenized in a thread pool."""
+    if len(string) * 4 <= limit:
+        return None
+
+    if len(string) < TOKENIZE_IN_THREAD_CHARS and model in _encodings:
+        return count_tokens_over_limit(string, limit, model)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _tokenizer_pool, count_tokens_over_limit, string, limit, model
+    )
+
+
+class OpenRouterError(Exception):
+    """Error returned by OpenRouter, either before or in the middle of a stream."""
+
+
+@dataclass(slots=True)
+class Usage:
+    """Tokens, timing and provider of one request to OpenRouter."""
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    latency_ms: int | None = None
+    # Time to the first token, the same as `latency_ms` without streaming
+    ttft_ms: int | None = None
+    provider: str | None = None
+    # In USD, what OpenRouter reported until it's priced by the catalog
+    cost: float | None = None
+
+    def update(self, response: dict) -> None:
+        """Picks the usage block and the provider out of a response or a stream chunk."""
+        if isinstance(response.get("provider"), str):
+            self.provider = response["provider"]
+        usage = response.get("usage")
+        if not isinstance(usage, dict):
+            return
+        self.prompt_tokens = usage.get("prompt_tokens", self.prompt_tokens)
+        self.completion_tokens = usage.get("completion_tokens", self.completion_tokens)
+        self.cost = usage.get("cost", self.cost)
+
+
+def elapsed_ms(started_at: float) -> int:
+    return round((time.perf_counter() - started_at) * 1000)
+
+
+def build_request(
+    model: str,
     messages: list[dict] | None = None,
     prompt: str | None = None,
-    model: str = "openai/gpt-4o-mini",
-) -> dict | None:
+) -> dict:
     if (not messages and not prompt) or (messages and prompt):
         raise ValueError("Either `messages` or `prompt` must be provided")
 
@@ -26,16 +122,33 @@ async def create_response(
         "max_tokens": 1000,
         "reasoning": {
             "exclude": True
+        },
+        # Asks OpenRouter to add the cost to the usage block
+        "usage": {
+            "include": True
         }
     }
     if messages:
         json_data["messages"] = messages
     else:
         json_data["prompt"] = prompt
+    return json_data
 
-    async with aiohttp.ClientSession(headers=headers) as session:
-        async with session.post(url+"/chat/completions", json=json_data) as request:
-            response = await request.json()
+
+async def create_response(
+    headers: dict,
+    url: str,
+    messages: list[dict] | None = None,
+    prompt: str | None = None,
+    model: str = "openai/gpt-4o-mini",
+) -> dict | None:
+    json_data = build_request(model, messages, prompt)
+
+    started_at = time.perf_counter()
+    session = await openrouter_client.get_session()
+    async with session.post(url+"/chat/completions", headers=headers, json=json_data) as request:
+        response = await request.json()
+    latency_ms = elapsed_ms(started_at)
 
     logger.info(f"Got response from OpenRouter: {response}")
 
@@ -46,4 +159,95 @@ async def create_response(
     if response.get("choices"):
         choice = response["choices"][0]
         msg = choice.get("text") or choice["message"]["content"]
-        return {"status": "success", "response": msg}
+        usage = Usage(latency_ms=latency_ms, ttft_ms=latency_ms)
+        usage.update(response)
+        return {"status": "success", "response": msg, "usage": usage}
+
+
+async def stream_response(
+    headers: dict,
+    url: str,
+    messages: list[dict] | None = None,
+    prompt: str | None = None,
+    model: str = "openai/gpt-4o-mini",
+    usage: Usage | None = None,
+) -> AsyncIterator[str]:
+    """Yields text deltas of the completion as OpenRouter streams them over SSE.
+
+    If `usage` is passed, it's filled with the usage from the last chunk and the timings.
+    """
+    json_data = build_request(model, messages, prompt)
+    json_data["stream"] = True
+
+    started_at = time.perf_counter()
+    session = await openrouter_client.get_session()
+    async with session.post(url+"/chat/completions", headers=headers, json=json_data) as request:
+        if request.status != 200:
+            try:
+                response = await request.json(content_type=None)
+            except ValueError:
+                # Gateways answer with HTML or plain text
+                response = None
+            if not isinstance(response, dict):
+                logger.error(f"Error from OpenRouter: {request.status} {request.reason}")
+                raise OpenRouterError(request.reason or f"HTTP {request.status}")
+            logger.error(f"Error from OpenRouter: {response}")
+            raise OpenRouterError(response.get("error", {}).get("message", request.reason))
+
+        async for raw_line in request.content:
+            line = raw_line.strip()
+            # Empty lines separate events, lines starting with ":" are keep-alive comments
+            if not line or line.startswith(b":") or not line.startswith(b"data:"):
+                continue
+
+            data = line[5:].strip()
+            if data == b"[DONE]":
+                break
+
+            chunk = orjson.loads(data)
+            if chunk.get("error"):
+                logger.error(f"Error from OpenRouter: {chunk['error']}")
+                raise OpenRouterError(chunk["error"]["message"])
+
+            if usage is not None:
+                usage.update(chunk)
+            if not chunk.get("choices"):
+                continue
+
+            choice = chunk["choices"][0]
+            delta = choice.get("text") or (choice.get("delta") or {}).get("content")
+            if delta:
+                if usage is not None and usage.ttft_ms is None:
+                    usage.ttft_ms = elapsed_ms(started_at)
+                yield delta
+
+    if usage is not None:
+        usage.latency_ms = elapsed_ms(started_at)
+
+
+async def create_response_stream(
+    headers: dict,
+    url: str,
+    messages: list[dict] | None = None,
+    prompt: str | None = None,
+    model: str = "openai/gpt-4o-mini",
+    on_delta: Callable[[str], Awaitable[None]] | None = None,
+    usage: Usage | None = None,
+) -> dict | None:
+    """Same as `create_response`, but passes every delta to `on_delta` as it arrives.
+
+    `usage` is filled as the stream goes, so it's there even if the request is cancelled.
+    """
+    chunks: list[str] = []
+    usage = usage if usage is not None else Usage()
+    try:
+        async for delta in stream_response(headers, url, messages, prompt, model, usage):
+            chunks.append(delta)
+            if on_delta is not None:
+                await on_delta(delta)
+    except OpenRouterError as e:
+        return {"status": "error", "response": str(e)}
+
+    logger.info(f"Got {len(chunks)} chunks from OpenRouter")
+    if chunks:
+        return {"status": "success", "response": "".join(chunks), "usage": usage}
@@ -1,12 +1,13 @@
 from dataclasses import dataclass
 from typing import List
 
-import aiofiles
-import yaml
-from jinja2.sandbox import ImmutableSandboxedEnvironment
 from unidecode import unidecode
 
-from bot.core.config import settings
+from bot.core.config import Model
+from bot.templates import template_registry
+
+# Chat messages, or a prompt rendered with an instruction template
+RenderedPrompt = tuple[list[dict] | None, str | None]
 
 
 @dataclass(frozen=True)
@@ -57,22 +58,20 @@ class Prompt:
         return messages
 
     async def full_render_template(self, bot_id: str, template_name: str) -> str:
-        jinja_env = ImmutableSandboxedEnvironment(trim_blocks=True, lstrip_blocks=True)
         rendered = self.full_render(bot_id)
 
-        async with aiofiles.open(
-            f"{settings.instruction_template_path}/{template_name}.yaml", 'r', encoding='utf-8'
-        ) as f:
-            content = await f.read()
-        data = yaml.safe_load(content)
-        instruction_template_str = data['instruction_template']
-        instruction_template = jinja_env.from_string(instruction_template_str)
-
+        instruction_template = template_registry.get(template_name)
         instruction = instruction_template.render(
             messages=rendered, add_generation_prompt=True
         )
         return instruction
 
+    async def render_for(self, bot_id: str, model: Model) -> RenderedPrompt:
+        """Renders the prompt in the format the model expects."""
+        if model.source == "bot" and model.template:
+            return None, await self.full_render_template(bot_id, model.template)
+        return self.full_render(bot_id), None
+
     def render_messages(self, bot_id: str):
         for message in self.convo.messages:
             # `message.user_id` for bots always starts with a `-`
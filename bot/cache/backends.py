@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any
+
+from loguru import logger
+from redis.exceptions import RedisError
+
+from bot.cache.local import MISSING, LocalCache
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+# Removes the key only if it still holds the expected value
+_DELETE_IF_EQUALS = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+class CacheUnavailableError(Exception):
+    """Raised by backends when their storage can't be reached."""
+
+
+class CacheBackend(ABC):
+    """Storage used by `cached` and the cache invalidation helpers."""
+
+    @abstractmethod
+    async def get(self, key: str) -> bytes | None:
+        """Returns the value or None if there's no such key."""
+
+    @abstractmethod
+    async def mget(self, keys: list[str]) -> list[bytes | None]:
+        """Returns values of all keys, None for the missing ones."""
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        """Sets the value, expiring it after `ttl` seconds if set."""
+
+    @abstractmethod
+    async def add(self, key: str, value: bytes | str, ttl: float) -> bool:
+        """Sets the value only if the key doesn't exist, returns whether it was set."""
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> None:
+        """Removes the keys."""
+
+    @abstractmethod
+    async def delete_if_equals(self, key: str, value: bytes | str) -> None:
+        """Removes the key only if it still holds the value."""
+
+    @abstractmethod
+    async def incr(self, *keys: str) -> None:
+        """Increments the counters, missing ones start from 0."""
+
+    @abstractmethod
+    async def hget(self, key: str, field: str) -> bytes | None:
+        """Returns a field of the hash, None if there's no such hash or field."""
+
+    @abstractmethod
+    async def hgetall(self, key: str) -> dict[str, bytes]:
+        """Returns all fields of the hash, an empty dict if there's no such hash."""
+
+    @abstractmethod
+    async def hreplace(self, key: str, mapping: dict[str, bytes]) -> None:
+        """Replaces the whole hash at once, readers never see a half-written one."""
+
+    async def publish(self, channel: str, *messages: str) -> None:
+        """Notifies other processes, a no-op for backends that aren't shared."""
+
+
+class RedisBackend(CacheBackend):
+    """Cache stored in Redis and shared by all bot processes."""
+
+    def __init__(self, redis: Redis) -> None:
+        self.redis = redis
+
+    @contextmanager
+    def _errors(self) -> Iterator[None]:
+        try:
+            yield
+        except RedisError as e:
+            raise CacheUnavailableError(str(e)) from e
+
+    async def get(self, key: str) -> bytes | None:
+        with self._errors():
+            return await self.redis.get(key)
+
+    async def mget(self, keys: list[str]) -> list[bytes | None]:
+        with self._errors():
+            return await self.redis.mget(keys)
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        with self._errors():
+            await self.redis.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    async def add(self, key: str, value: bytes | str, ttl: float) -> bool:
+        with self._errors():
+            return bool(await self.redis.set(key, value, nx=True, px=int(ttl * 1000)))
+
+    async def delete(self, *keys: str) -> None:
+        with self._errors():
+            await self.redis.delete(*keys)
+
+    async def delete_if_equals(self, key: str, value: bytes | str) -> None:
+        with self._errors():
+            await self.redis.eval(_DELETE_IF_EQUALS, 1, key, value)
+
+    async def incr(self, *keys: str) -> None:
+        with self._errors():
+            async with self.redis.pipeline(transaction=False) as pipeline:
+                for key in keys:
+                    pipeline.incr(key)
+                await pipeline.execute()
+
+    async def hget(self, key: str, field: str) -> bytes | None:
+        with self._errors():
+            return await self.redis.hget(key, field)
+
+    async def hgetall(self, key: str) -> dict[str, bytes]:
+        with self._errors():
+            return {field.decode(): value for field, value in (await self.redis.hgetall(key)).items()}
+
+    async def hreplace(self, key: str, mapping: dict[str, bytes]) -> None:
+        with self._errors():
+            async with self.redis.pipeline(transaction=True) as pipeline:
+                pipeline.delete(key)
+                if mapping:
+                    pipeline.hset(key, mapping=mapping)
+                await pipeline.execute()
+
+    async def publish(self, channel: str, *messages: str) -> None:
+        with self._errors():
+            async with self.redis.pipeline(transaction=False) as pipeline:
+                for message in messages:
+                    pipeline.publish(channel, message)
+                await pipeline.execute()
+
+
+class MemoryBackend(CacheBackend):
+    """Cache kept in the process memory, for single-node deployments or when Redis is down."""
+
+    def __init__(self, maxsize: int = 10_000) -> None:
+        self.data = LocalCache(maxsize)
+
+    def _get(self, key: str) -> bytes | None:
+        value = self.data.get(key)
+        return None if value is MISSING else value
+
+    def _set(self, key: str, value: bytes, ttl: float | None) -> None:
+        self.data.set(key, value, ttl if ttl else float("inf"))
+
+    async def get(self, key: str) -> bytes | None:
+        return self._get(key)
+
+    async def mget(self, keys: list[str]) -> list[bytes | None]:
+        return [self._get(key) for key in keys]
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        self._set(key, value, ttl)
+
+    async def add(self, key: str, value: bytes | str, ttl: float) -> bool:
+        if self._get(key) is not None:
+            return False
+        self._set(key, value, ttl)
+        return True
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self.data.delete(key)
+
+    async def delete_if_equals(self, key: str, value: bytes | str) -> None:
+        if self._get(key) == value:
+            self.data.delete(key)
+
+    async def incr(self, *keys: str) -> None:
+        for key in keys:
+            self._set(key, b"%d" % (int(self._get(key) or 0) + 1), None)
+
+    async def hget(self, key: str, field: str) -> bytes | None:
+        return (await self.hgetall(key)).get(field)
+
+    async def hgetall(self, key: str) -> dict[str, bytes]:
+        return self._get(key) or {}
+
+    async def hreplace(self, key: str, mapping: dict[str, bytes]) -> None:
+        self._set(key, dict(mapping), None)
+
+
+class FailoverBackend(CacheBackend):
+    """Uses the primary backend, and the fallback one while the primary is failing.
+
+    After `failure_threshold` errors in a row the primary isn't touched for
+    `retry_after` seconds. Keys deleted and counters bumped in the meantime are
+    replayed on the primary before it's used again, so it doesn't serve values
+    that were invalidated during the outage.
+    """
+
+    def __init__(
+        self,
+        primary: CacheBackend,
+        fallback: CacheBackend,
+        failure_threshold: int = 3,
+        retry_after: float = 10,
+        max_replay: int = 10_000,
+    ) -> None:
+        self.primary = primary
+        self.fallback = fallback
+        self.failure_threshold = failure_threshold
+        self.retry_after = retry_after
+        self.max_replay = max_replay
+
+        self.failures = 0
+        self.open_until = 0.0
+        self._deleted: set[str] = set()
+        self._incremented: set[str] = set()
+        self._replay_overflow = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.failures >= self.failure_threshold
+
+    async def _primary_available(self) -> bool:
+        if not self.is_open:
+            return True
+        if time.monotonic() < self.open_until:
+            return False
+
+        # Half-open: try to catch the primary up and close the circuit
+        self.open_until = time.monotonic() + self.retry_after
+        try:
+            if self._deleted:
+                await self.primary.delete(*self._deleted)
+            if self._incremented:
+                await self.primary.incr(*self._incremented)
+        except CacheUnavailableError:
+            return False
+
+        if self._replay_overflow:
+            logger.warning("Too many invalidations while the cache was down, some values may be stale")
+        logger.info("Cache backend is available again")
+        self.failures = 0
+        self._deleted.clear()
+        self._incremented.clear()
+        self._replay_overflow = False
+        return True
+
+    def _failed(self, e: CacheUnavailableError) -> None:
+        self.failures += 1
+        if self.failures == self.failure_threshold:
+            logger.error(f"Cache backend is down, using the fallback for {self.retry_after}s: {e}")
+        if self.is_open:
+            self.open_until = time.monotonic() + self.retry_after
+
+    def _remember(self, keys: set[str], new_keys: tuple[str, ...]) -> None:
+        if len(self._deleted) + len(self._incremented) + len(new_keys) > self.max_replay:
+            self._replay_overflow = True
+            return
+        keys.update(new_keys)
+
+    async def _call(self, method: str, *args: Any) -> Any:
+        if await self._primary_available():
+            try:
+                result = await getattr(self.primary, method)(*args)
+            except CacheUnavailableError as e:
+                self._failed(e)
+            else:
+                self.failures = 0
+                return result
+
+        if method == "delete":
+            self._remember(self._deleted, args)
+        elif method == "incr":
+            self._remember(self._incremented, args)
+        return await getattr(self.fallback, method)(*args)
+
+    async def get(self, key: str) -> bytes | None:
+        return await self._call("get", key)
+
+    async def mget(self, keys: list[str]) -> list[bytes | None]:
+        return await self._call("mget", keys)
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        await self._call("set", key, value, ttl)
+
+    async def add(self, key: str, value: bytes | str, ttl: float) -> bool:
+        return await self._call("add", key, value, ttl)
+
+    async def delete(self, *keys: str) -> None:
+        await self._call("delete", *keys)
+
+    async def delete_if_equals(self, key: str, value: bytes | str) -> None:
+        await self._call("delete_if_equals", key, value)
+
+    async def incr(self, *keys: str) -> None:
+        await self._call("incr", *keys)
+
+    async def hget(self, key: str, field: str) -> bytes | None:
+        return await self._call("hget", key, field)
+
+    async def hgetall(self, key: str) -> dict[str, bytes]:
+        return await self._call("hgetall", key)
+
+    async def hreplace(self, key: str, mapping: dict[str, bytes]) -> None:
+        await self._call("hreplace", key, mapping)
+
+    async def publish(self, channel: str, *messages: str) -> None:
+        await self._call("publish", channel, *messages)
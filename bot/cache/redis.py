@@ -1,24 +1,92 @@
 from __future__ import annotations
-from functools import wraps
+
+import asyncio
+import math
+import random
+import secrets
+import struct
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import update_wrapper, wraps
 from typing import TYPE_CHECKING, Any, TypeVar
 
-from bot.cache.serialization import AbstractSerializer, PickleSerializer
-from bot.core.loader import redis_client
+from loguru import logger
+from redis.exceptions import RedisError
+
+from bot.cache.backends import CacheBackend
+from bot.cache.local import MISSING, LocalCache
+from bot.cache.serialization import AbstractSerializer, RecordSerializer, SerializationError
+from bot.core.config import settings
+from bot.core.loader import cache_backend, redis_client
 
 if TYPE_CHECKING:
-    from collections.abc import Awaitable, Callable
+    from collections.abc import Awaitable, Callable, Iterable
     from datetime import timedelta
 
-    from redis.asyncio import Redis
-
 
 DEFAULT_TTL = 10
+# Tagged entries are invalidated on writes, so they can live much longer
+TAGGED_TTL = 600
+INVALIDATION_CHANNEL = "cache:invalidate"
+# Lease of the recompute lock, it's released early once the value is stored
+LOCK_TIMEOUT = 5.0
+LOCK_POLL_INTERVAL = 0.05
+
+# Cached values are prefixed with the moment they go stale, how long they took to compute
+# and the versions of their tags at that time
+_ENVELOPE = struct.Struct("!2sddH")
+_ENVELOPE_MAGIC = b"c2"
+_TAG_PREFIX = "tag:"
 
 _Func = TypeVar("_Func")
 Args = str | int | None  # basically only user_id is used as identifier
 Kwargs = Any
 
 
+@dataclass
+class TierStats:
+    local_hits: int = 0
+    redis_hits: int = 0
+    misses: int = 0
+    # Stale values served while another caller was recomputing them
+    stale_hits: int = 0
+    recomputes: int = 0
+    early_refreshes: int = 0
+
+    @property
+    def calls(self) -> int:
+        return self.local_hits + self.redis_hits + self.misses
+
+    @property
+    def local_hit_rate(self) -> float:
+        return self.local_hits / self.calls if self.calls else 0.0
+
+    @property
+    def redis_hit_rate(self) -> float:
+        total = self.redis_hits + self.misses
+        return self.redis_hits / total if total else 0.0
+
+
+local_cache = LocalCache(maxsize=settings.CACHE_LOCAL_SIZE)
+default_serializer = RecordSerializer()
+# Bumped whenever a tag is invalidated, in-process entries remember the values they saw
+_local_tag_epochs: defaultdict[str, int] = defaultdict(int)
+# Hits and misses per cached function
+cache_stats: defaultdict[str, TierStats] = defaultdict(TierStats)
+
+
+def log_cache_stats() -> None:
+    """Logs how often every cached function that was called was answered by each tier."""
+    for name, stats in sorted(cache_stats.items()):
+        if not stats.calls:
+            continue
+        logger.info(
+            f"Cache {name}: {stats}, {stats.local_hit_rate:.0%} in-process,"
+            f" {stats.redis_hit_rate:.0%} of the rest from Redis"
+        )
+
+
 def build_key(*args: Args, **kwargs: Kwargs) -> str:
     """Build a string key based on provided arguments and keyword arguments."""
     args_str = ":".join(map(str, args))
@@ -30,64 +98,291 @@ async def set_redis_value(
     key: bytes | str,
     value: bytes | str,
     ttl: int | timedelta | None = DEFAULT_TTL,
-    is_transaction: bool = False,
+    cache: CacheBackend = cache_backend,
 ) -> None:
-    """Set a value in Redis with an optional time-to-live (TTL)."""
-    async with redis_client.pipeline(transaction=is_transaction) as pipeline:
-        await pipeline.set(key, value)
-        if ttl:
-            await pipeline.expire(key, ttl)
+    """Set a value in the cache with an optional time-to-live (TTL)."""
+    await cache.set(key, value, _seconds(ttl) if ttl else None)
+
+
+def _seconds(ttl: int | timedelta) -> float:
+    return ttl if isinstance(ttl, (int, float)) else ttl.total_seconds()
+
+
+def pack_value(
+    payload: bytes, fresh_until: float, delta: float, versions: tuple[int, ...] = ()
+) -> bytes:
+    header = _ENVELOPE.pack(_ENVELOPE_MAGIC, fresh_until, delta, len(versions))
+    return header + struct.pack(f"!{len(versions)}q", *versions) + payload
+
+
+def unpack_value(raw: bytes) -> tuple[bytes, float, float, tuple[int, ...]] | None:
+    """Returns the payload, the moment it goes stale, its compute time and tag versions,
+    or None for values in another format."""
+    if len(raw) < _ENVELOPE.size or not raw.startswith(_ENVELOPE_MAGIC):
+        return None
+    _, fresh_until, delta, tags_count = _ENVELOPE.unpack_from(raw)
+    versions = struct.unpack_from(f"!{tags_count}q", raw, _ENVELOPE.size)
+    return raw[_ENVELOPE.size + tags_count * 8:], fresh_until, delta, versions
+
+
+def tag_key(tag: str) -> str:
+    return f"tagver:{tag}"
+
 
-        await pipeline.execute()
+def decode_value(
+    key: str, raw: bytes | None, versions: tuple[int, ...], serializer: AbstractSerializer
+) -> tuple[Any, float, float] | None:
+    """Returns the value with the moment it goes stale and its compute time.
+
+    Values written before one of their tags was invalidated, or that can't be
+    deserialized anymore, are treated as missing.
+    """
+    unpacked = unpack_value(raw) if raw is not None else None
+    if unpacked is None or unpacked[3] != versions:
+        return None
+
+    payload, fresh_until, delta, _ = unpacked
+    try:
+        return serializer.deserialize(payload), fresh_until, delta
+    except SerializationError as e:
+        logger.debug(f"Dropping cached {key}: {e}")
+        return None
+
+
+async def fetch_value(
+    cache: CacheBackend, key: str, tags: tuple[str, ...], serializer: AbstractSerializer
+) -> tuple[tuple[Any, float, float] | None, tuple[int, ...]]:
+    """Gets the value and the current versions of its tags in one round-trip."""
+    if tags:
+        raw, *raw_versions = await cache.mget([key, *map(tag_key, tags)])
+        versions = tuple(int(version or 0) for version in raw_versions)
+    else:
+        raw = await cache.get(key)
+        versions = ()
+
+    return decode_value(key, raw, versions, serializer), versions
+
+
+def should_refresh_early(fresh_until: float, delta: float, beta: float) -> bool:
+    """Probabilistic early expiration (XFetch): the closer to expiry and the slower
+    the computation, the likelier a caller refreshes the value before it goes stale."""
+    return time.time() - delta * beta * math.log(1 - random.random()) >= fresh_until
+
+
+async def acquire_lock(cache: CacheBackend, key: str, timeout: float = LOCK_TIMEOUT) -> str | None:
+    """Takes the recompute lock for the key, returns its token or None if someone else holds it."""
+    token = secrets.token_hex(8)
+    if await cache.add(f"lock:{key}", token, timeout):
+        return token
+    return None
+
+
+async def release_lock(cache: CacheBackend, key: str, token: str) -> None:
+    # Only delete our own lock, it could've expired and been taken by another caller
+    await cache.delete_if_equals(f"lock:{key}", token)
+
+
+@dataclass
+class CachedCall:
+    """Arguments of a cached function call."""
+
+    function: CachedFunction
+    key: str
+    tags: tuple[str, ...]
+    # In-process tag epochs seen before the lookup
+    epochs: tuple[int, ...]
+    args: tuple[Args, ...]
+    kwargs: dict[str, Kwargs]
+
+
+class CachedFunction:
+    """A function wrapped by `cached`, see its docstring for the options."""
+
+    def __init__(
+        self,
+        func: Callable[..., Awaitable[Any]],
+        ttl: int | timedelta,
+        namespace: str,
+        cache: CacheBackend,
+        key_builder: Callable[..., str],
+        serializer: AbstractSerializer,
+        local_ttl: float | None,
+        lock: bool,
+        stale_ttl: int | timedelta | None,
+        early_refresh: float | None,
+        tags: Callable[..., Iterable[str]] | None,
+    ) -> None:
+        update_wrapper(self, func)
+        self.func = func
+        self.namespace = namespace
+        self.cache = cache
+        self.key_builder = key_builder
+        self.serializer = serializer
+        self.local_ttl = local_ttl
+        self.early_refresh = early_refresh
+        self.tags = tags
+
+        self.fresh_seconds = _seconds(ttl)
+        self.stale_seconds = _seconds(stale_ttl) if stale_ttl is not None else 0
+        self.use_lock = lock or stale_ttl is not None or early_refresh is not None
+        self.stats = cache_stats[f"{func.__module__}:{func.__name__}"]
+
+    def call(self, *args: Args, **kwargs: Kwargs) -> CachedCall:
+        key = self.key_builder(*args, **kwargs)
+        key = f"{self.namespace}:{self.func.__module__}:{self.func.__name__}:{key}"
+        value_tags = tuple(self.tags(*args, **kwargs)) if self.tags is not None else ()
+        epochs = tuple(_local_tag_epochs[tag] for tag in value_tags)
+        return CachedCall(self, key, value_tags, epochs, args, kwargs)
+
+    async def __call__(self, *args: Args, **kwargs: Kwargs) -> Any:
+        call = self.call(*args, **kwargs)
+        result = self.get_local(call)
+        if result is not MISSING:
+            return result
+
+        # Check if the key is in the cache
+        found, versions = await fetch_value(self.cache, call.key, call.tags, self.serializer)
+        return await self.resolve(call, found, versions)
+
+    def get_local(self, call: CachedCall) -> Any:
+        if self.local_ttl is None:
+            return MISSING
+        local_value = local_cache.get(call.key)
+        if local_value is MISSING or local_value[1] != call.epochs:
+            return MISSING
+        self.stats.local_hits += 1
+        return local_value[0]
+
+    def store_locally(self, call: CachedCall, result: Any) -> None:
+        if self.local_ttl is not None:
+            local_cache.set(call.key, (result, call.epochs), self.local_ttl)
+
+    async def resolve(
+        self,
+        call: CachedCall,
+        found: tuple[Any, float, float] | None,
+        versions: tuple[int, ...],
+    ) -> Any:
+        """Returns the value fetched from Redis, or recomputes it."""
+        if found is None:
+            self.stats.misses += 1
+            if self.use_lock:
+                return await self.recompute_locked(call, versions)
+            return await self.recompute(call, versions)
+
+        result, fresh_until, delta = found
+        stale = time.time() >= fresh_until
+        early = (
+            not stale
+            and self.early_refresh is not None
+            and should_refresh_early(fresh_until, delta, self.early_refresh)
+        )
+        if (stale or early) and self.use_lock:
+            token = await acquire_lock(self.cache, call.key)
+            if token is not None:
+                if early:
+                    self.stats.early_refreshes += 1
+                try:
+                    return await self.recompute(call, versions)
+                finally:
+                    await release_lock(self.cache, call.key, token)
+        elif stale:
+            self.stats.misses += 1
+            return await self.recompute(call, versions)
+
+        if stale:
+            # Someone else is already recomputing it
+            self.stats.stale_hits += 1
+        else:
+            self.stats.redis_hits += 1
+            self.store_locally(call, result)
+        return result
+
+    async def recompute(self, call: CachedCall, versions: tuple[int, ...]) -> Any:
+        # Versions are read before the call, so an invalidation during it isn't lost
+        self.stats.recomputes += 1
+        started_at = time.monotonic()
+        result = await self.func(*call.args, **call.kwargs)
+        delta = time.monotonic() - started_at
+
+        data = self.serializer.serialize(result)
+        # Misses return what hits do, e.g. records instead of live ORM rows
+        result = self.serializer.deserialize(data)
+        payload = pack_value(data, time.time() + self.fresh_seconds, delta, versions)
+        # Stale values stay in Redis a bit longer than they're considered fresh
+        ttl = math.ceil(self.fresh_seconds + self.stale_seconds)
+        await set_redis_value(key=call.key, value=payload, ttl=ttl, cache=self.cache)
+        self.store_locally(call, result)
+        return result
+
+    async def recompute_locked(self, call: CachedCall, versions: tuple[int, ...]) -> Any:
+        """Recomputes the value, or waits for whoever is already doing it."""
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while True:
+            token = await acquire_lock(self.cache, call.key)
+            if token is not None:
+                try:
+                    return await self.recompute(call, versions)
+                finally:
+                    await release_lock(self.cache, call.key, token)
+
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            found, versions = await fetch_value(self.cache, call.key, call.tags, self.serializer)
+            if found is not None:
+                self.store_locally(call, found[0])
+                return found[0]
+
+            if time.monotonic() >= deadline:
+                # The lock holder is stuck or gone, don't wait for it forever
+                return await self.recompute(call, versions)
 
 
 def cached(
     ttl: int | timedelta = DEFAULT_TTL,
     namespace: str = "main",
-    cache: Redis = redis_client,
+    cache: CacheBackend = cache_backend,
     key_builder: Callable[..., str] = build_key,
     serializer: AbstractSerializer | None = None,
-) -> Callable[[Callable[..., Awaitable[_Func]]], Callable[..., Awaitable[_Func]]]:
+    local_ttl: float | None = None,
+    lock: bool = False,
+    stale_ttl: int | timedelta | None = None,
+    early_refresh: float | None = None,
+    tags: Callable[..., Iterable[str]] | None = None,
+) -> Callable[[Callable[..., Awaitable[Any]]], CachedFunction]:
     """Caches the function's return value into a key generated with module_name, function_name, and args.
 
     Args:
         ttl (int | timedelta): Time-to-live for the cached value.
         namespace (str): Namespace for cache keys.
-        cache (Redis): Redis instance for storing cached data.
+        cache (CacheBackend): Backend for storing cached data.
         key_builder (Callable[..., str]): Function to build cache keys.
         serializer (AbstractSerializer | None): Serializer for cache data.
+        local_ttl (float | None): If set, values are also kept in the in-process
+            cache for this many seconds, so hot keys don't need a Redis round-trip.
+        lock (bool): Only one caller recomputes a missing key at a time, the others
+            wait for its result instead of all hitting the database or the API.
+        stale_ttl (int | timedelta | None): If set, expired values are kept for this long
+            and returned while one caller recomputes them. Implies `lock`.
+        early_refresh (float | None): If set, values are sometimes recomputed before
+            they expire, with this value as the XFetch beta (1.0 is a sane default).
+        tags (Callable[..., Iterable[str]] | None): Builds the entity tags of the value from
+            the function's arguments, like `user:<id>`. The value is dropped as soon as
+            `invalidate_tags` is called for any of them.
 
     Returns:
         Callable: A decorator that wraps the original function with caching logic.
+            Values always go through the serializer, so with the default one ORM rows
+            come back as read-only records, whether the value was cached or not.
 
     """
     if serializer is None:
-        serializer = PickleSerializer()
-
-    def decorator(func: Callable[..., Awaitable[_Func]]) -> Callable[..., Awaitable[_Func]]:
-        @wraps(func)
-        async def wrapper(*args: Args, **kwargs: Kwargs) -> Any:
-            key = key_builder(*args, **kwargs)
-            key = f"{namespace}:{func.__module__}:{func.__name__}:{key}"
+        serializer = default_serializer
 
-            # Check if the key is in the cache
-            cached_value = await cache.get(key)
-            if cached_value is not None:
-                return serializer.deserialize(cached_value)
-
-            # If not in cache, call the original function
-            result = await func(*args, **kwargs)
-
-            # Store the result in Redis
-            await set_redis_value(
-                key=key,
-                value=serializer.serialize(result),
-                ttl=ttl,
-            )
-
-            return result
-
-        return wrapper
+    def decorator(func: Callable[..., Awaitable[Any]]) -> CachedFunction:
+        return CachedFunction(
+            func, ttl, namespace, cache, key_builder, serializer,
+            local_ttl, lock, stale_ttl, early_refresh, tags,
+        )
 
     return decorator
 
@@ -114,4 +409,62 @@ async def clear_cache(
     key = build_key(*args, **kwargs)
     key = f"{namespace}:{func.__module__}:{func.__name__}:{key}"
 
-    await redis_client.delete(key)
\ No newline at end of file
+    local_cache.delete(key)
+    await cache_backend.delete(key)
+    # Other processes drop the key from their in-process caches
+    await cache_backend.publish(INVALIDATION_CHANNEL, key)
+
+
+async def invalidate_tags(*tags: str) -> None:
+    """Drops every cached value tagged with any of the tags, in all processes."""
+    for tag in tags:
+        _local_tag_epochs[tag] += 1
+
+    await cache_backend.incr(*map(tag_key, tags))
+    await cache_backend.publish(INVALIDATION_CHANNEL, *(_TAG_PREFIX + tag for tag in tags))
+
+
+def invalidates(
+    tags: Callable[..., Iterable[str]],
+) -> Callable[[Callable[..., Awaitable[_Func]]], Callable[..., Awaitable[_Func]]]:
+    """Invalidates the tags built from the function's arguments after it succeeds."""
+
+    def decorator(func: Callable[..., Awaitable[_Func]]) -> Callable[..., Awaitable[_Func]]:
+        @wraps(func)
+        async def wrapper(*args: Args, **kwargs: Kwargs) -> Any:
+            result = await func(*args, **kwargs)
+            await invalidate_tags(*tags(*args, **kwargs))
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+async def listen_for_invalidations() -> None:
+    """Drops keys cleared by other processes from the in-process cache."""
+    while True:
+        try:
+            async with redis_client.pubsub() as pubsub:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                # We could've missed invalidations while we weren't subscribed
+                local_cache.clear()
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    data = message["data"].decode()
+                    if data.startswith(_TAG_PREFIX):
+                        _local_tag_epochs[data.removeprefix(_TAG_PREFIX)] += 1
+                    else:
+                        local_cache.delete(data)
+        except RedisError as e:
+            logger.warning(f"Lost the cache invalidation channel: {e}")
+            local_cache.clear()
+            await asyncio.sleep(1)
+
+
+def start_invalidation_listener() -> asyncio.Task | None:
+    if settings.CACHE_BACKEND == "memory":
+        # Nothing to listen to, the cache isn't shared
+        return None
+    return asyncio.create_task(listen_for_invalidations())
\ No newline at end of file
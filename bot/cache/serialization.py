@@ -1,9 +1,25 @@
 # ruff: noqa: S301
 import pickle
+import zlib
 from abc import ABC, abstractmethod
+from collections import namedtuple
+from collections.abc import Iterable
+from dataclasses import dataclass, fields, is_dataclass
+from datetime import datetime
 from typing import Any
 
 import orjson
+from pydantic import BaseModel
+from sqlalchemy import DateTime, Table
+from sqlalchemy.orm import DeclarativeBase
+
+from bot.core.config import Model, ModelDeprecation
+from bot.database.models import Base
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 
 class AbstractSerializer(ABC):
@@ -35,4 +51,148 @@ class JSONSerializer(AbstractSerializer):
 
     def deserialize(self, obj: str) -> Any:
         """Deserialize values using JSON."""
-        return orjson.loads(obj)
\ No newline at end of file
+        return orjson.loads(obj)
+
+class SerializationError(Exception):
+    """Raised when a cached value can't be restored, e.g. because its schema changed."""
+
+
+@dataclass(frozen=True)
+class TableSchema:
+    name: str
+    columns: tuple[str, ...]
+    datetime_columns: frozenset[str]
+    # Rows cached before a migration have another fingerprint and are treated as missing
+    fingerprint: int
+    record: type[tuple]
+
+    @classmethod
+    def from_table(cls, table: Table) -> "TableSchema":
+        columns = tuple(column.name for column in table.columns)
+        signature = ",".join(f"{column.name}:{column.type}" for column in table.columns)
+        record_name = "".join(part.title() for part in table.name.split("_")) + "Record"
+        return cls(
+            name=table.name,
+            columns=columns,
+            datetime_columns=frozenset(
+                column.name for column in table.columns if isinstance(column.type, DateTime)
+            ),
+            fingerprint=zlib.crc32(signature.encode()),
+            record=namedtuple(record_name, columns),
+        )
+
+
+class RecordSerializer(AbstractSerializer):
+    """Serialize ORM rows, pydantic models and dataclasses as plain orjson records.
+
+    Rows come back as read-only namedtuples with the same attributes, without
+    any SQLAlchemy state, so they are cheap to load and survive model class changes.
+    Only models and dataclasses passed in `models` and `dataclasses` are rebuilt,
+    other dataclasses come back as dicts.
+    Payloads over `compress_threshold` bytes are compressed with zstd if it's
+    installed, zlib otherwise.
+    """
+
+    _RAW = b"\x00"
+    _ZLIB = b"\x01"
+    _ZSTD = b"\x02"
+
+    def __init__(
+        self,
+        base: type[DeclarativeBase] = Base,
+        models: Iterable[type[BaseModel]] = (Model, ModelDeprecation),
+        dataclasses: Iterable[type] = (),
+        compress_threshold: int | None = 2048,
+    ) -> None:
+        self.schemas = {
+            mapper.local_table.name: TableSchema.from_table(mapper.local_table)
+            for mapper in base.registry.mappers
+        }
+        self.record_schemas = {schema.record: schema for schema in self.schemas.values()}
+        self.models = {model.__name__: model for model in models}
+        self.dataclasses = {cls.__name__: cls for cls in dataclasses}
+        self.compress_threshold = compress_threshold
+
+    def serialize(self, obj: Any) -> bytes:
+        data = orjson.dumps(obj, default=self._default, option=orjson.OPT_PASSTHROUGH_DATACLASS)
+        if self.compress_threshold is None or len(data) < self.compress_threshold:
+            return self._RAW + data
+        if zstandard is not None:
+            return self._ZSTD + zstandard.ZstdCompressor().compress(data)
+        return self._ZLIB + zlib.compress(data)
+
+    def deserialize(self, obj: bytes) -> Any:
+        """Deserialize records, rebuilding rows and models."""
+        flag, data = obj[:1], obj[1:]
+        try:
+            if flag == self._ZSTD:
+                if zstandard is None:
+                    raise SerializationError("zstandard isn't installed")
+                data = zstandard.ZstdDecompressor().decompress(data)
+            elif flag == self._ZLIB:
+                data = zlib.decompress(data)
+            elif flag != self._RAW:
+                raise SerializationError(f"Unknown payload format {flag!r}")
+            value = orjson.loads(data)
+            # Walking big plain payloads like the model catalog is slower than parsing them
+            if b'"__row__"' in data or b'"__model__"' in data or b'"__data__"' in data:
+                value = self._restore(value)
+            return value
+        except (orjson.JSONDecodeError, zlib.error, ValueError, TypeError) as e:
+            raise SerializationError(str(e)) from e
+
+    def _default(self, obj: Any) -> Any:
+        if isinstance(obj, DeclarativeBase):
+            schema = self.schemas[obj.__table__.name]
+        elif type(obj) in self.record_schemas:
+            schema = self.record_schemas[type(obj)]
+        elif isinstance(obj, BaseModel) and type(obj).__name__ in self.models:
+            # Nested models are passed to `_default` too
+            return {
+                "__model__": type(obj).__name__,
+                "d": {field: getattr(obj, field) for field in type(obj).model_fields},
+            }
+        elif is_dataclass(obj):
+            values = {field.name: getattr(obj, field.name) for field in fields(obj)}
+            if type(obj).__name__ not in self.dataclasses:
+                return values
+            return {"__data__": type(obj).__name__, "d": values}
+        else:
+            raise TypeError(f"Can't serialize {type(obj).__name__}")
+
+        return {
+            "__row__": schema.name,
+            "v": schema.fingerprint,
+            "c": [getattr(obj, column) for column in schema.columns],
+        }
+
+    def _restore(self, obj: Any) -> Any:
+        if isinstance(obj, list):
+            return [self._restore(item) for item in obj]
+        if not isinstance(obj, dict):
+            return obj
+
+        if "__row__" in obj:
+            schema = self.schemas.get(obj["__row__"])
+            if schema is None or obj["v"] != schema.fingerprint:
+                raise SerializationError(f"Schema of {obj['__row__']} has changed")
+            values = dict(zip(schema.columns, obj["c"]))
+            for column in schema.datetime_columns:
+                if values[column] is not None:
+                    values[column] = datetime.fromisoformat(values[column])
+            return schema.record(**values)
+
+        if "__model__" in obj:
+            model = self.models.get(obj["__model__"])
+            if model is None:
+                raise SerializationError(f"Unknown model {obj['__model__']}")
+            # They were valid when cached, and validating settings models re-reads the environment
+            return model.model_construct(**self._restore(obj["d"]))
+
+        if "__data__" in obj:
+            cls = self.dataclasses.get(obj["__data__"])
+            if cls is None:
+                raise SerializationError(f"Unknown dataclass {obj['__data__']}")
+            return cls(**self._restore(obj["d"]))
+
+        return {key: self._restore(value) for key, value in obj.items()}
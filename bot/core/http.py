@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+import aiohttp
+from loguru import logger
+
+
+@dataclass
+class PoolStats:
+    requests: int = 0
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    # How many times a request had to wait for a free connection
+    saturated: int = 0
+    saturated_wait: float = 0.0
+
+
+class PooledClient:
+    """Long-lived aiohttp session that keeps connections to the upstream API alive.
+
+    The session is created on startup and closed on shutdown, so every request
+    reuses the same connector instead of doing a new TCP+TLS handshake.
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 50,
+        keepalive_timeout: float = 30,
+        dns_cache_ttl: int = 300,
+        connect_timeout: float = 10,
+        read_timeout: float = 180,
+    ) -> None:
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+        self.stats = PoolStats()
+        self._session: aiohttp.ClientSession | None = None
+
+    @property
+    def started(self) -> bool:
+        return self._session is not None and not self._session.closed
+
+    async def start(self) -> None:
+        if self.started:
+            return
+
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_cache_ttl,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            connect=self.connect_timeout,
+            sock_read=self.read_timeout,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            trace_configs=[self._trace_config()],
+        )
+        logger.info(
+            f"Started HTTP pool (limit={self.limit}, per_host={self.limit_per_host})"
+        )
+
+    async def close(self) -> None:
+        if self._session is None:
+            return
+
+        await self._session.close()
+        self._session = None
+        logger.info(f"Closed HTTP pool: {self.stats}")
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Returns the shared session, starting it if the startup hook didn't run."""
+        if not self.started:
+            await self.start()
+        assert self._session is not None
+        return self._session
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_request_end.append(self._on_request_done)
+        trace_config.on_request_exception.append(self._on_request_done)
+        trace_config.on_connection_queued_start.append(self._on_queued_start)
+        trace_config.on_connection_queued_end.append(self._on_queued_end)
+        return trace_config
+
+    async def _on_request_start(self, _session, ctx: SimpleNamespace, _params) -> None:
+        self.stats.requests += 1
+        self.stats.in_flight += 1
+        self.stats.peak_in_flight = max(self.stats.peak_in_flight, self.stats.in_flight)
+
+    async def _on_request_done(self, _session, _ctx: SimpleNamespace, _params) -> None:
+        self.stats.in_flight -= 1
+
+    async def _on_queued_start(self, _session, ctx: SimpleNamespace, _params) -> None:
+        ctx.queued_at = time.monotonic()
+        self.stats.saturated += 1
+        logger.debug(f"HTTP pool is saturated ({self.stats.in_flight} requests in flight)")
+
+    async def _on_queued_end(self, _session, ctx: SimpleNamespace, _params) -> None:
+        queued_at = getattr(ctx, "queued_at", None)
+        if queued_at is not None:
+            self.stats.saturated_wait += time.monotonic() - queued_at
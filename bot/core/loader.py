@@ -4,7 +4,10 @@ from telegrinder import Dispatch, Telegrinder, Token
 from vkbottle import API as VkAPI
 from vkbottle.bot import Bot
 
+from bot.cache.backends import CacheBackend, FailoverBackend, MemoryBackend, RedisBackend
 from bot.core.config import settings
+from bot.core.http import PooledClient
+from bot.core.redis_gate import RedisGate
 
 # VK
 vk_api = VkAPI(settings.VK_API_KEY)  # pyright: ignore
@@ -21,5 +24,30 @@ redis_client = Redis(
         port=settings.REDIS_PORT,
         password=settings.REDIS_PASS,
         db=0,
+        socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
     ),
-)
\ No newline at end of file
+)
+cache_backend: CacheBackend
+if settings.CACHE_BACKEND == "memory":
+    cache_backend = MemoryBackend(settings.CACHE_LOCAL_SIZE)
+else:
+    # Falls back to the process memory while Redis is down
+    cache_backend = FailoverBackend(
+        RedisBackend(redis_client),
+        MemoryBackend(settings.CACHE_LOCAL_SIZE),
+        retry_after=settings.CACHE_RETRY_AFTER,
+    )
+# Used by the circuit breaker and the rate limiter, which talk to Redis directly
+redis_gate = RedisGate(
+    None if settings.CACHE_BACKEND == "memory" else redis_client, settings.CACHE_RETRY_AFTER
+)
+
+# OpenRouter
+openrouter_client = PooledClient(
+    limit=settings.HTTP_POOL_SIZE,
+    limit_per_host=settings.HTTP_POOL_PER_HOST,
+    keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT,
+    dns_cache_ttl=settings.HTTP_DNS_CACHE_TTL,
+    connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+    read_timeout=settings.HTTP_READ_TIMEOUT,
+)
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import time
+
+from loguru import logger
+from redis.asyncio import Redis
+
+
+class RedisGate:
+    """Tells the code using Redis directly whether it's worth trying.
+
+    Without Redis (the memory cache backend) it never is. After an error Redis
+    isn't tried for `retry_after` seconds, so callers fall back right away instead
+    of waiting for the connect timeout on every call.
+    """
+
+    def __init__(self, redis: Redis | None, retry_after: float = 10) -> None:
+        self.redis = redis
+        self.retry_after = retry_after
+        self.down_until = 0.0
+
+    @property
+    def available(self) -> bool:
+        return self.redis is not None and time.monotonic() >= self.down_until
+
+    def failed(self, e: Exception) -> None:
+        if self.available:
+            logger.warning(f"Redis failed, not using it for {self.retry_after}s: {e}")
+        self.down_until = time.monotonic() + self.retry_after
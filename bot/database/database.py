@@ -1,14 +1,157 @@
 from __future__ import annotations
 
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import (
     AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 )
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+from bot.core.config import settings
+
+
+class RoutingSession(Session):
+    """Sends reads to the read-only engine, and everything after the first write
+    in a transaction to the writer, so the transaction sees its own changes."""
+
+    writing = False
+
+    def get_bind(self, mapper: Any = None, clause: Any = None, **kwargs: Any) -> Any:
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.writing = True
+        if self.writing:
+            return self.info["writer"].sync_engine
+        return self.info["reader"].sync_engine
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def stop_writing(session: RoutingSession, transaction: Any) -> None:
+    if transaction.parent is None:
+        session.writing = False
+
+
+def create_engine(
+    url: str,
+    read_only: bool = False,
+    pool_size: int = 5,
+    max_overflow: int | None = None,
+    pool_timeout: float = 30,
+    wal: bool = True,
+    busy_timeout: int = 5000,
+    cache_size: int = 16_384,
+    mmap_size: int = 256 * 1024 * 1024,
+    statement_cache_size: int = 100,
+    command_timeout: float = 30,
+) -> AsyncEngine:
+    """Creates an engine for SQLite or PostgreSQL.
+
+    SQLite connections are tuned with pragmas: with WAL readers don't block the
+    writer and the other way around, and `synchronous=NORMAL` only syncs on
+    checkpoints. `busy_timeout` makes connections wait for the write lock, e.g.
+    held by the other bot process, instead of failing with "database is locked".
+
+    PostgreSQL connections (asyncpg) cache `statement_cache_size` prepared
+    statements and cancel queries running longer than `command_timeout` seconds.
+    """
+    parsed_url = make_url(url)
+    pool_options: dict[str, Any] = {
+        "pool_size": pool_size,
+        "max_overflow": pool_size if max_overflow is None else max_overflow,
+        "pool_timeout": pool_timeout,
+    }
+
+    if parsed_url.get_backend_name() == "postgresql":
+        try:
+            return create_async_engine(
+                # SQLAlchemy keeps its own cache of prepared statements on top of asyncpg's
+                parsed_url.update_query_dict(
+                    {"prepared_statement_cache_size": str(statement_cache_size)}
+                ),
+                pool_pre_ping=True,
+                connect_args={
+                    "statement_cache_size": statement_cache_size,
+                    "command_timeout": command_timeout,
+                    "server_settings": {"statement_timeout": str(int(command_timeout * 1000))},
+                },
+                **pool_options,
+            )
+        except ModuleNotFoundError as e:
+            raise ModuleNotFoundError(
+                "PostgreSQL support needs asyncpg, install the `postgres` extra"
+            ) from e
+
+    engine = create_async_engine(parsed_url, **pool_options)
+    if parsed_url.get_backend_name() != "sqlite":
+        return engine
+
+    pragmas = {
+        "busy_timeout": busy_timeout,
+        # Negative values are in KiB instead of pages
+        "cache_size": -cache_size,
+        "mmap_size": mmap_size,
+        "temp_store": "MEMORY",
+    }
+    if wal:
+        pragmas["journal_mode"] = "WAL"
+        pragmas["synchronous"] = "NORMAL"
+    if read_only:
+        pragmas["query_only"] = "ON"
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection: Any, _connection_record: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return engine
+
+
+def get_sessionmaker(
+    engine: AsyncEngine, read_engine: AsyncEngine | None = None
+) -> async_sessionmaker[AsyncSession]:
+    if read_engine is None:
+        return async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+    return async_sessionmaker(
+        sync_session_class=RoutingSession,
+        info={"writer": engine, "reader": read_engine},
+        autoflush=False,
+        expire_on_commit=False,
+    )
+
+
+def create_engines(url: str) -> tuple[AsyncEngine, AsyncEngine | None]:
+    """Creates the engines configured in the settings.
 
+    SQLite gets a writer and a separate read-only engine, PostgreSQL handles
+    concurrent writers itself, so it only gets one pool.
+    """
+    if make_url(url).get_backend_name() != "sqlite":
+        engine = create_engine(
+            url,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            statement_cache_size=settings.DB_STATEMENT_CACHE_SIZE,
+            command_timeout=settings.DB_COMMAND_TIMEOUT,
+        )
+        return engine, None
 
-def get_sessionmaker(engine: AsyncEngine) -> async_sessionmaker[AsyncSession]:
-    return async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    options = {
+        "wal": settings.DB_WAL,
+        "busy_timeout": settings.DB_BUSY_TIMEOUT,
+        "cache_size": settings.DB_CACHE_SIZE,
+        "mmap_size": settings.DB_MMAP_SIZE,
+    }
+    writer = create_engine(url, pool_size=settings.DB_WRITE_POOL_SIZE, **options)
+    reader = create_engine(url, read_only=True, pool_size=settings.DB_READ_POOL_SIZE, **options)
+    return writer, reader
 
 
-db_url = "sqlite+aiosqlite:///db.db"
-engine = create_async_engine(url=db_url)
-sessionmaker = get_sessionmaker(engine)
+db_url = settings.database_url
+engine, read_engine = create_engines(str(db_url))
+sessionmaker = get_sessionmaker(engine, read_engine)
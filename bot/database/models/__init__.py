@@ -1,6 +1,8 @@
 from .base import Base
 from .generations import GenerationsModel
 from .mood import MoodModel
+from .mood_stats import MoodStatsModel
+from .usage_daily import UsageDailyModel
 from .user import UserModel
 
-__all__ = ["Base", "GenerationsModel", "MoodModel", "UserModel"]
\ No newline at end of file
+__all__ = ["Base", "GenerationsModel", "MoodModel", "MoodStatsModel", "UsageDailyModel", "UserModel"]
\ No newline at end of file
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from typing import Optional
 
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column
 
 from bot.database.models.base import Base, created_at, int_pk
@@ -10,6 +10,12 @@ from bot.database.models.base import Base, created_at, int_pk
 
 class GenerationsModel(Base):
     __tablename__ = "generations"
+    __table_args__ = (
+        # Generations are mostly counted, including the id lets Postgres skip the table
+        Index("ix_generations_mood_id", "mood_id", postgresql_include=["id"]),
+        Index("ix_generations_user_id_model", "user_id", "model", postgresql_include=["id"]),
+        Index("ix_generations_model", "model", postgresql_include=["id"]),
+    )
 
     id: Mapped[int_pk]
 
@@ -19,4 +25,12 @@ class GenerationsModel(Base):
     mood_id: Mapped[Optional[int]] = mapped_column(ForeignKey("moods.id", ondelete="SET NULL"))
     parent_gen_id: Mapped[Optional[int]] = mapped_column(ForeignKey("generations.id", ondelete="CASCADE"))
 
+    # Usage of the request, empty for old generations and for ones sharing another's request
+    prompt_tokens: Mapped[Optional[int]]
+    completion_tokens: Mapped[Optional[int]]
+    latency_ms: Mapped[Optional[int]]
+    ttft_ms: Mapped[Optional[int]]
+    provider: Mapped[Optional[str]]
+    cost: Mapped[Optional[float]]
+
     created_at: Mapped[created_at]
\ No newline at end of file
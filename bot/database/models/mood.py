@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column
 
 from bot.database.models.base import Base, created_at, int_pk
@@ -8,6 +8,7 @@ from bot.database.models.base import Base, created_at, int_pk
 
 class MoodModel(Base):
     __tablename__ = "moods"
+    __table_args__ = (Index("ix_moods_user_id_is_private", "user_id", "is_private"),)
 
     id: Mapped[int_pk]
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
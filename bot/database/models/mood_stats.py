@@ -0,0 +1,20 @@
+from __future__ import annotations
+
+from sqlalchemy import ForeignKey, Index, text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from bot.database.models.base import Base
+
+
+class MoodStatsModel(Base):
+    """Generation counts of moods, kept up to date by `add_generations`."""
+    __tablename__ = "mood_stats"
+    __table_args__ = (
+        # Popular moods are read straight from the index, most popular first
+        Index("ix_mood_stats_generations", "generations", "mood_id"),
+    )
+
+    mood_id: Mapped[int] = mapped_column(
+        ForeignKey("moods.id", ondelete="CASCADE"), primary_key=True, autoincrement=False
+    )
+    generations: Mapped[int] = mapped_column(default=0, server_default=text("0"))
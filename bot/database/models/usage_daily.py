@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import datetime
+
+from sqlalchemy import BigInteger, text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from bot.database.models.base import Base
+
+
+class UsageDailyModel(Base):
+    """Usage of generations summed per day, model and mood, kept up to date by `add_generations`."""
+    __tablename__ = "usage_daily"
+
+    # The primary key doubles as the index for reading a range of days
+    day: Mapped[datetime.date] = mapped_column(primary_key=True)
+    model: Mapped[str] = mapped_column(primary_key=True)
+    # Not a foreign key, the usage of deleted moods stays
+    mood_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+
+    generations: Mapped[int] = mapped_column(default=0, server_default=text("0"))
+    # Generations with usage, averages are over these
+    metered: Mapped[int] = mapped_column(default=0, server_default=text("0"))
+    prompt_tokens: Mapped[int] = mapped_column(BigInteger, default=0, server_default=text("0"))
+    completion_tokens: Mapped[int] = mapped_column(BigInteger, default=0, server_default=text("0"))
+    cost: Mapped[float] = mapped_column(default=0, server_default=text("0"))
+    latency_ms: Mapped[int] = mapped_column(BigInteger, default=0, server_default=text("0"))
+    ttft_ms: Mapped[int] = mapped_column(BigInteger, default=0, server_default=text("0"))
+    # Hedged requests that lost to another model's answer, they're paid for too.
+    # Most are cancelled before OpenRouter reports their cost, so it's often unknown
+    lost: Mapped[int] = mapped_column(default=0, server_default=text("0"))
+    lost_cost: Mapped[float] = mapped_column(default=0, server_default=text("0"))
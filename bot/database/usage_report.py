@@ -0,0 +1,61 @@
+"""Prints how much the generations used, for capacity planning.
+
+Reads the daily rollup instead of the generations, so it's cheap however
+many there are. Days are in UTC:
+
+    python -m bot.database.usage_report --days 7
+    python -m bot.database.usage_report --days 30 --by model mood_id
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime
+
+from bot.database.database import engine, read_engine, sessionmaker
+from bot.services.generations import USAGE_GROUPS, get_usage
+
+
+def average(total: int, count: int) -> str:
+    return f"{total / count:.0f}" if count else "-"
+
+
+async def report(days: int, group_by: list[str]) -> None:
+    since = datetime.datetime.now(datetime.UTC).date() - datetime.timedelta(days=days - 1)
+    async with sessionmaker() as session:
+        rows = await get_usage(session, since, group_by=group_by)
+
+    header = [*group_by, "generations", "prompt", "completion", "cost, $", "latency, ms", "ttft, ms", "lost", "lost cost, $"]
+    lines = [
+        [
+            *(str(row[column]) for column in group_by),
+            str(row["generations"]),
+            str(row["prompt_tokens"]),
+            str(row["completion_tokens"]),
+            f"{row['cost']:.4f}",
+            average(row["latency_ms"], row["metered"]),
+            average(row["ttft_ms"], row["metered"]),
+            str(row["lost"]),
+            f"{row['lost_cost']:.4f}",
+        ]
+        for row in rows
+    ]
+    widths = [max(len(line[i]) for line in [header, *lines]) for i in range(len(header))]
+    for line in [header, *lines]:
+        print("  ".join(value.ljust(width) for value, width in zip(line, widths)))
+
+    await engine.dispose()
+    if read_engine is not None:
+        await read_engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=7, help="how many last days to include, today too")
+    parser.add_argument("--by", nargs="+", choices=USAGE_GROUPS, default=["day", "model"])
+    args = parser.parse_args()
+    asyncio.run(report(args.days, args.by))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import dataclass
+from typing import Literal
+
+from loguru import logger
+from redis.exceptions import RedisError
+
+from bot.core.config import settings
+from bot.core.loader import redis_gate
+from bot.core.redis_gate import RedisGate
+
+BreakerState = Literal["closed", "open", "half_open"]
+
+# The rolling window is split into this many buckets
+BUCKETS = 6
+
+
+class CircuitOpenError(Exception):
+    """Raised when a request is short-circuited because the model is unavailable."""
+
+
+@dataclass(frozen=True)
+class ModelHealth:
+    state: BreakerState
+    requests: int = 0
+    errors: int = 0
+    avg_latency: float = 0.0
+
+    @property
+    def score(self) -> float:
+        """Share of successful requests in the window, 1.0 means the model is healthy."""
+        return 1 - self.errors / self.requests if self.requests else 1.0
+
+
+class CircuitBreaker:
+    """Per-model circuit breaker that keeps its state in Redis.
+
+    Errors and slow responses of every model are counted in a rolling window.
+    When the share of failures gets too high, the model is marked as open and
+    every request to it fails instantly until the cooldown ends. After that the
+    model is half-open: one request at a time is let through as a probe, its
+    failure opens the model again, its success closes it. The state is shared
+    between the VK and TG processes. Without Redis every request is let through.
+    """
+
+    def __init__(self, gate: RedisGate = redis_gate) -> None:
+        self.gate = gate
+        self.redis = gate.redis
+
+    @property
+    def _bucket_size(self) -> float:
+        return settings.circuit_breaker.window / BUCKETS
+
+    def _bucket_keys(self, model_name: str) -> list[str]:
+        current = int(time.time() // self._bucket_size)
+        return [f"breaker:{model_name}:bucket:{current - i}" for i in range(BUCKETS)]
+
+    async def allow(self, model_name: str) -> bool:
+        """Checks if requests to the model may go through."""
+        if not self.gate.available:
+            return True
+        try:
+            is_open, tripped = await self.redis.mget(
+                f"breaker:{model_name}:open", f"breaker:{model_name}:tripped"
+            )
+            if is_open:
+                return False
+            if not tripped:
+                return True
+            # Half-open: a single probe, until it answers or would be counted as too slow
+            return bool(
+                await self.redis.set(
+                    f"breaker:{model_name}:probe", 1,
+                    nx=True, ex=math.ceil(settings.circuit_breaker.slow_ms / 1000),
+                )
+            )
+        except RedisError as e:
+            self.gate.failed(e)
+            return True
+
+    async def record(self, model_name: str, success: bool, latency: float) -> None:
+        """Records the outcome of a request and trips the breaker if needed."""
+        if not self.gate.available:
+            return
+        config = settings.circuit_breaker
+        failed = not success or latency * 1000 > config.slow_ms
+        bucket_keys = self._bucket_keys(model_name)
+
+        try:
+            async with self.redis.pipeline(transaction=False) as pipeline:
+                pipeline.hincrby(bucket_keys[0], "err" if failed else "ok", 1)
+                pipeline.hincrbyfloat(bucket_keys[0], "latency", latency)
+                pipeline.expire(bucket_keys[0], int(config.window + self._bucket_size))
+                pipeline.exists(f"breaker:{model_name}:tripped")
+                for key in bucket_keys:
+                    pipeline.hgetall(key)
+                results = await pipeline.execute()
+
+            half_open = bool(results[3])
+            if not failed:
+                if half_open:
+                    await self.redis.delete(f"breaker:{model_name}:tripped", f"breaker:{model_name}:probe")
+                    logger.info(f"Circuit breaker for {model_name} is closed again")
+                return
+
+            health = self._health("closed", results[4:])
+            if half_open or (
+                health.requests >= config.min_requests
+                and health.errors / health.requests >= config.error_rate
+            ):
+                await self._trip(model_name, bucket_keys)
+        except RedisError as e:
+            self.gate.failed(e)
+
+    async def _trip(self, model_name: str, bucket_keys: list[str]) -> None:
+        config = settings.circuit_breaker
+        logger.warning(f"Circuit breaker for {model_name} is open for {config.open_for}s")
+        async with self.redis.pipeline(transaction=True) as pipeline:
+            pipeline.set(f"breaker:{model_name}:open", 1, ex=config.open_for)
+            # Stays after the cooldown, so the model is half-open until it answers
+            pipeline.set(f"breaker:{model_name}:tripped", 1, ex=config.open_for * 10)
+            pipeline.delete(*bucket_keys, f"breaker:{model_name}:probe")
+            await pipeline.execute()
+
+    async def status(self, model_names: list[str]) -> dict[str, ModelHealth]:
+        """Returns the state and health of every model in one round-trip."""
+        if not self.gate.available:
+            return {model_name: ModelHealth("closed") for model_name in model_names}
+        try:
+            async with self.redis.pipeline(transaction=False) as pipeline:
+                for model_name in model_names:
+                    pipeline.exists(f"breaker:{model_name}:open")
+                    pipeline.exists(f"breaker:{model_name}:tripped")
+                    for key in self._bucket_keys(model_name):
+                        pipeline.hgetall(key)
+                results = await pipeline.execute()
+        except RedisError as e:
+            self.gate.failed(e)
+            return {model_name: ModelHealth("closed") for model_name in model_names}
+
+        status = {}
+        step = 2 + BUCKETS
+        for i, model_name in enumerate(model_names):
+            is_open, tripped, *buckets = results[i * step:(i + 1) * step]
+            state: BreakerState = "open" if is_open else ("half_open" if tripped else "closed")
+            status[model_name] = self._health(state, buckets)
+        return status
+
+    @staticmethod
+    def _health(state: BreakerState, buckets: list[dict]) -> ModelHealth:
+        ok = errors = 0
+        latency = 0.0
+        for bucket in buckets:
+            ok += int(bucket.get(b"ok", 0))
+            errors += int(bucket.get(b"err", 0))
+            latency += float(bucket.get(b"latency", 0))
+        requests = ok + errors
+        return ModelHealth(
+            state=state,
+            requests=requests,
+            errors=errors,
+            avg_latency=latency / requests if requests else 0.0,
+        )
+
+
+breaker = CircuitBreaker()
@@ -0,0 +1,175 @@
+"""Index of the models available on OpenRouter.
+
+The `/models` list is fetched in the background by one bot process at a time
+and published as a hash in the cache, every process keeps a copy of it as a
+dict by model id. Lookups don't touch the network, and if OpenRouter is down
+the last good snapshot keeps being served, even after a restart.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+
+import aiohttp
+import orjson
+from loguru import logger
+
+from bot.cache.backends import CacheBackend
+from bot.core.config import OPENROUTER_HEADERS, Model, settings
+from bot.core.http import PooledClient
+from bot.core.loader import cache_backend, openrouter_client
+
+CATALOG_KEY = "catalog:models"
+# Changes on every publish, so processes know when to reload the hash
+CATALOG_VERSION_KEY = "catalog:version"
+# Held for `refresh_interval` by the process that fetched the catalog last
+REFRESH_LOCK_KEY = "catalog:refresh"
+# How often processes check for a newer catalog and whether it's time to refetch it
+SYNC_INTERVAL = 60
+
+
+@dataclass(frozen=True, slots=True)
+class CatalogModel:
+    """The part of OpenRouter's model description the bot uses."""
+    id: str
+    name: str
+    pricing: dict[str, str] | None = None
+
+    def to_model(self) -> Model:
+        return Model(id=self.id, name=self.id, display_name=self.name)
+
+    def cost(self, prompt_tokens: int, completion_tokens: int) -> float | None:
+        """Price of a request in USD, None if the catalog doesn't know the prices."""
+        if not self.pricing:
+            return None
+        try:
+            return (
+                float(self.pricing.get("prompt", 0)) * prompt_tokens
+                + float(self.pricing.get("completion", 0)) * completion_tokens
+                + float(self.pricing.get("request", 0))
+            )
+        except ValueError:
+            return None
+
+
+def parse_catalog(body: bytes) -> dict[str, CatalogModel]:
+    """Picks ids, names and prices out of the `/models` response, skipping broken entries."""
+    models = {}
+    for item in orjson.loads(body)["data"]:
+        if not isinstance(item, dict) or not isinstance(item.get("id"), str):
+            continue
+        pricing = item.get("pricing")
+        models[item["id"]] = CatalogModel(
+            id=item["id"],
+            name=str(item.get("name") or item["id"]),
+            pricing={key: str(value) for key, value in pricing.items()} if isinstance(pricing, dict) else None,
+        )
+    return models
+
+
+def pack_model(model: CatalogModel) -> bytes:
+    return orjson.dumps([model.name, model.pricing])
+
+
+def unpack_model(model_id: str, data: bytes) -> CatalogModel:
+    name, pricing = orjson.loads(data)
+    return CatalogModel(id=model_id, name=name, pricing=pricing)
+
+
+class ModelCatalog:
+    def __init__(
+        self,
+        client: PooledClient,
+        cache: CacheBackend,
+        refresh_interval: float = 1800,
+    ) -> None:
+        self.client = client
+        self.cache = cache
+        self.refresh_interval = refresh_interval
+
+        self.models: dict[str, CatalogModel] = {}
+        self.version: bytes | None = None
+        self._load_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    async def get(self, model_id: str) -> CatalogModel | None:
+        if self.models:
+            return self.models.get(model_id)
+
+        # Nothing in the process yet, e.g. right after startup
+        data = await self.cache.hget(CATALOG_KEY, model_id)
+        if data is not None:
+            return unpack_model(model_id, data)
+        await self.load()
+        return self.models.get(model_id)
+
+    async def load(self) -> None:
+        """Loads the published catalog, or fetches it if nobody did yet."""
+        async with self._load_lock:
+            if self.models:
+                return
+            await self.sync()
+            if not self.models:
+                await self.refresh()
+
+    async def fetch(self) -> dict[str, CatalogModel]:
+        session = await self.client.get_session()
+        async with session.get(settings.OPENAI_BASE_URL + "/models", headers=OPENROUTER_HEADERS) as response:
+            response.raise_for_status()
+            body = await response.read()
+        return parse_catalog(body)
+
+    async def refresh(self) -> bool:
+        """Fetches the catalog and publishes it, the current one stays if that fails."""
+        started_at = time.perf_counter()
+        try:
+            models = await self.fetch()
+        except (aiohttp.ClientError, asyncio.TimeoutError, orjson.JSONDecodeError, KeyError, TypeError) as e:
+            logger.warning(f"Couldn't fetch the model catalog, keeping {len(self.models)} known models: {e!r}")
+            return False
+        if not models:
+            logger.warning(f"OpenRouter returned no models, keeping {len(self.models)} known models")
+            return False
+
+        version = str(time.time_ns()).encode()
+        await self.cache.hreplace(CATALOG_KEY, {model_id: pack_model(model) for model_id, model in models.items()})
+        await self.cache.set(CATALOG_VERSION_KEY, version)
+        self.models, self.version = models, version
+        logger.info(f"Fetched {len(models)} models from OpenRouter in {time.perf_counter() - started_at:.2f}s")
+        return True
+
+    async def sync(self) -> None:
+        """Picks up the catalog published by another process if it's newer than ours."""
+        version = await self.cache.get(CATALOG_VERSION_KEY)
+        if version is None or version == self.version:
+            return
+        published = await self.cache.hgetall(CATALOG_KEY)
+        if published:
+            self.models = {model_id: unpack_model(model_id, data) for model_id, data in published.items()}
+            self.version = version
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.sync()
+                # Only one process refetches the catalog, the others sync it from the cache
+                if await self.cache.add(REFRESH_LOCK_KEY, b"1", self.refresh_interval):
+                    if not await self.refresh():
+                        # Let the next check try again instead of waiting for the whole interval
+                        await self.cache.delete(REFRESH_LOCK_KEY)
+            except Exception as e:
+                logger.exception(f"Model catalog refresh failed: {e}")
+            await asyncio.sleep(SYNC_INTERVAL)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+model_catalog = ModelCatalog(openrouter_client, cache_backend, settings.MODEL_CATALOG_REFRESH_INTERVAL)
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+
+from loguru import logger
+
+from bot.core.config import Model
+from bot.generation.singleflight import OnDelta
+
+Attempt = Callable[[OnDelta | None], Awaitable[dict | None]]
+
+
+def is_success(result: dict | None) -> bool:
+    return bool(result) and result["status"] == "success"
+
+
+async def hedged_request(
+    attempts: list[tuple[Model, Attempt]],
+    hedge_after: float | None = None,
+    on_delta: OnDelta | None = None,
+) -> dict | None:
+    """Runs the attempts one after another until one of them succeeds.
+
+    The next attempt starts as soon as the previous one fails, or, if `hedge_after`
+    is set, when it hasn't answered in `hedge_after` seconds. In that case both
+    keep running and the first one to answer wins, the rest are cancelled.
+    When streaming, the first attempt to produce a token wins.
+
+    The returned result has the name of the model that answered under "model".
+    """
+    pending = list(attempts)
+    running: dict[asyncio.Task, Model] = {}
+    winner: asyncio.Task | None = None
+    last_result: dict | None = None
+    last_error: BaseException | None = None
+    hedge_at: float | None = None
+
+    def claim(task: asyncio.Task) -> bool:
+        nonlocal winner
+        if winner is None:
+            winner = task
+            for other in running:
+                if other is not task:
+                    other.cancel()
+        return winner is task
+
+    def wrap_on_delta() -> OnDelta | None:
+        if on_delta is None:
+            return None
+
+        async def attempt_on_delta(delta: str) -> None:
+            task = asyncio.current_task()
+            if task is not None and claim(task):
+                await on_delta(delta)
+        return attempt_on_delta
+
+    def start_next() -> None:
+        nonlocal hedge_at
+        model, attempt = pending.pop(0)
+        task = asyncio.create_task(attempt(wrap_on_delta()))
+        running[task] = model
+        hedge_at = time.monotonic() + hedge_after if hedge_after is not None else None
+
+    start_next()
+    try:
+        while running:
+            timeout = None
+            if winner is None and pending and hedge_at is not None:
+                timeout = max(hedge_at - time.monotonic(), 0)
+
+            done, _ = await asyncio.wait(
+                running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                logger.info(
+                    f"No answer in {hedge_after}s, hedging with {pending[0][0].name}"
+                )
+                start_next()
+                continue
+
+            for task in done:
+                model = running.pop(task)
+                if task.cancelled():
+                    continue
+
+                error = task.exception()
+                result = None if error else task.result()
+                if task is winner or (winner is None and is_success(result)):
+                    if error:
+                        raise error
+                    claim(task)
+                    if result is not None:
+                        result["model"] = model.name
+                    return result
+
+                if error:
+                    logger.warning(f"Request to {model.name} failed: {error!r}")
+                    last_error = error
+                else:
+                    logger.warning(f"Request to {model.name} failed: {result}")
+                    last_result = result
+                    last_error = None
+
+            if not running and pending and winner is None:
+                logger.info(f"Falling back to {pending[0][0].name}")
+                start_next()
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+    if last_error is not None:
+        raise last_error
+    return last_result
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+
+from loguru import logger
+
+from bot import ai_stuff
+from bot.base import RenderedPrompt
+from bot.core.config import OPENROUTER_HEADERS, Model, settings
+from bot.generation.breaker import CircuitOpenError, breaker
+from bot.generation.catalog import model_catalog
+from bot.generation.hedging import hedged_request, is_success
+from bot.generation.scheduler import scheduler
+from bot.generation.singleflight import OnDelta, build_request_key, singleflight
+from bot.utils import find_model_by_id
+
+Render = Callable[[Model], Awaitable[RenderedPrompt]]
+
+
+async def request_model(
+    model_name: str,
+    messages: list[dict] | None = None,
+    prompt: str | None = None,
+    on_delta: OnDelta | None = None,
+    usage: ai_stuff.Usage | None = None,
+) -> dict | None:
+    """Makes a single request to OpenRouter, streaming it if `on_delta` is passed.
+
+    A streamed request fills `usage` as it goes.
+    """
+    if on_delta is not None:
+        return await ai_stuff.create_response_stream(
+            OPENROUTER_HEADERS, settings.OPENAI_BASE_URL, messages, prompt, model_name,
+            on_delta=on_delta, usage=usage
+        )
+    return await ai_stuff.create_response(
+        OPENROUTER_HEADERS, settings.OPENAI_BASE_URL, messages, prompt, model_name
+    )
+
+
+def price_usage(model_name: str, usage: ai_stuff.Usage) -> None:
+    """Sets the cost of the request by the catalog prices, keeping OpenRouter's if there are none."""
+    if usage.prompt_tokens is None or usage.completion_tokens is None:
+        return
+    # Only the snapshot that's already loaded, the reply shouldn't wait for a catalog fetch
+    catalog_model = model_catalog.models.get(model_name)
+    cost = catalog_model.cost(usage.prompt_tokens, usage.completion_tokens) if catalog_model else None
+    if cost is not None:
+        usage.cost = cost
+
+
+def fallback_chain(model: Model) -> list[Model]:
+    """Returns the model followed by its fallback models from the config."""
+    chain = [model]
+    for model_id in model.fallback:
+        fallback = find_model_by_id(model_id)
+        if fallback is None or (fallback.deprecation and fallback.deprecation.is_deprecated):
+            logger.warning(f"Fallback model {model_id} of {model.name} doesn't exist or is deprecated")
+            continue
+        if fallback not in chain:
+            chain.append(fallback)
+    return chain
+
+
+async def generate(
+    model: Model,
+    render: Render,
+    user_id: int,
+    chat_id: int | None = None,
+    on_delta: OnDelta | None = None,
+) -> dict | None:
+    """Generates a response with the model or one of its fallbacks.
+
+    `render` renders the prompt for a model, fallbacks can expect another format.
+    Requests wait for a free slot of the model, identical in-flight requests are
+    shared if the model allows it. Raises `QueueFullError` or `CircuitOpenError`
+    if every model in the chain is overloaded or unavailable.
+
+    Hedged requests that were sent but lost to the answer are paid for too, they're
+    returned under "lost" as (model name, usage) with whatever usage they got.
+    """
+    rendered: dict[str, RenderedPrompt] = {}
+    answers: list[tuple[str, dict]] = []
+    lost: list[tuple[str, ai_stuff.Usage]] = []
+
+    async def render_once(render_model: Model) -> RenderedPrompt:
+        if render_model.name not in rendered:
+            rendered[render_model.name] = await render(render_model)
+        return rendered[render_model.name]
+
+    def attempt(attempt_model: Model):
+        async def run(on_delta: OnDelta | None) -> dict | None:
+            if not await breaker.allow(attempt_model.name):
+                raise CircuitOpenError(attempt_model.name)
+
+            messages, prompt = await render_once(attempt_model)
+            async with scheduler.slot(attempt_model, user_id, chat_id):
+                started_at = time.monotonic()
+                usage = ai_stuff.Usage()
+                try:
+                    result = await request_model(attempt_model.name, messages, prompt, on_delta, usage)
+                except asyncio.CancelledError:
+                    # Another model answered first
+                    lost.append((attempt_model.name, usage))
+                    raise
+                except Exception:
+                    await breaker.record(attempt_model.name, False, time.monotonic() - started_at)
+                    raise
+
+            await breaker.record(attempt_model.name, is_success(result), time.monotonic() - started_at)
+            if is_success(result):
+                if result.get("usage") is not None:
+                    price_usage(attempt_model.name, result["usage"])
+                answers.append((attempt_model.name, result))
+            return result
+        return run
+
+    async def run_chain(on_delta: OnDelta | None) -> dict | None:
+        attempts = [(chain_model, attempt(chain_model)) for chain_model in fallback_chain(model)]
+        hedge_after = model.hedge_after_ms / 1000 if model.hedge_after_ms is not None else None
+        result = await hedged_request(attempts, hedge_after, on_delta)
+        # Answers that came too late lost as well
+        lost.extend(
+            (name, answer["usage"]) for name, answer in answers
+            if answer is not result and answer.get("usage") is not None
+        )
+        for name, usage in lost:
+            price_usage(name, usage)
+        if result is not None:
+            result["lost"] = lost
+        return result
+
+    if not model.coalesce:
+        return await run_chain(on_delta)
+
+    led = False
+
+    async def lead(on_delta: OnDelta | None) -> dict | None:
+        nonlocal led
+        led = True
+        return await run_chain(on_delta)
+
+    key = build_request_key(model.name, *await render_once(model))
+    result = await singleflight.do(key, lead, on_delta)
+    if not led and result is not None and result.get("usage") is not None:
+        # Only the caller that made the request pays for it, the ones that joined it cost nothing
+        result = {**result, "usage": None, "lost": []}
+    return result
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from redis.exceptions import RedisError
+
+from bot.core.config import Model, RateLimit, settings
+from bot.core.loader import redis_gate
+from bot.core.redis_gate import RedisGate
+
+# Token buckets: every request takes a token from each of its buckets, or from
+# none of them if one is empty. Redis' clock is used, so every process agrees on it.
+# KEYS are the buckets, ARGV has the size and the refill rate per second of each.
+# Returns the number of the bucket to wait for and how long, or {0, "0"}.
+TAKE_TOKEN = """
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local tokens = {}
+local limited, wait = 0, 0
+
+for i, key in ipairs(KEYS) do
+    local size, rate = tonumber(ARGV[i * 2 - 1]), tonumber(ARGV[i * 2])
+    local bucket = redis.call("HMGET", key, "tokens", "at")
+    local left = tonumber(bucket[1]) or size
+    local at = tonumber(bucket[2]) or now
+    tokens[i] = math.min(size, left + math.max(0, now - at) * rate)
+    if tokens[i] < 1 and (1 - tokens[i]) / rate > wait then
+        limited, wait = i, (1 - tokens[i]) / rate
+    end
+end
+if limited > 0 then
+    return {limited, tostring(wait)}
+end
+
+for i, key in ipairs(KEYS) do
+    local size, rate = tonumber(ARGV[i * 2 - 1]), tonumber(ARGV[i * 2])
+    redis.call("HSET", key, "tokens", tostring(tokens[i] - 1), "at", tostring(now))
+    -- Gone once it would be full again, a full bucket is the same as no bucket
+    redis.call("PEXPIRE", key, math.ceil((size - tokens[i] + 1) / rate * 1000))
+end
+return {0, "0"}
+"""
+
+
+@dataclass(frozen=True, slots=True)
+class RateLimited:
+    # "user", "chat" or "price"
+    scope: str
+    retry_after: float
+
+
+class RateLimiter:
+    """Limits how often users and chats can generate, shared by the VK and TG processes.
+
+    Every check is one call of a Lua script, so it's atomic and takes one round-trip.
+    Without Redis or while it's down, requests aren't limited.
+    """
+
+    def __init__(self, gate: RedisGate = redis_gate) -> None:
+        self.gate = gate
+        self.redis = gate.redis
+        self._take_token = self.redis.register_script(TAKE_TOKEN) if self.redis is not None else None
+
+    async def load(self) -> None:
+        """Loads the script in advance, so the first request doesn't have to."""
+        if not self.gate.available:
+            return
+        try:
+            await self.redis.script_load(TAKE_TOKEN)
+        except RedisError as e:
+            self.gate.failed(e)
+
+    async def _take(self, buckets: list[tuple[str, str, RateLimit]]) -> RateLimited | None:
+        if not buckets or not self.gate.available:
+            return None
+        args = []
+        for _, _, limit in buckets:
+            args += [limit.burst, limit.per_minute / 60]
+        try:
+            limited, wait = await self._take_token(keys=[key for _, key, _ in buckets], args=args)
+        except RedisError as e:
+            self.gate.failed(e)
+            return None
+        if not limited:
+            return None
+        return RateLimited(buckets[int(limited) - 1][0], float(wait))
+
+    async def check(self, platform: str, user_id: int, chat_id: int | None = None) -> RateLimited | None:
+        """Takes a request from the user's and the chat's limits, before anything else is done."""
+        config = settings.rate_limit
+        limits = config.platforms.get(platform)
+        if not config.enabled or limits is None:
+            return None
+
+        buckets = []
+        if limits.user is not None:
+            buckets.append(("user", f"ratelimit:{platform}:user:{user_id}", limits.user))
+        # Private chats are already limited by the user's limit
+        if limits.chat is not None and chat_id is not None and chat_id != user_id:
+            buckets.append(("chat", f"ratelimit:{platform}:chat:{chat_id}", limits.chat))
+        return await self._take(buckets)
+
+    async def check_model(self, platform: str, user_id: int, model: Model) -> RateLimited | None:
+        """Takes a request from the user's limit of the model's price tier, if it has one."""
+        config = settings.rate_limit
+        tiers = [tier for tier in config.price_tiers if model.price >= tier.min_price]
+        if not config.enabled or not tiers:
+            return None
+
+        # The most expensive tier the model is in
+        tier = max(tiers, key=lambda tier: tier.min_price)
+        return await self._take(
+            [("price", f"ratelimit:{platform}:price:{tier.min_price}:user:{user_id}", tier.limit)]
+        )
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+from loguru import logger
+
+from bot.core.config import Model, settings
+
+
+class QueueFullError(Exception):
+    """Raised when a model already has as many waiting requests as it can queue."""
+
+
+@dataclass
+class QueueStats:
+    running: int = 0
+    waiting: int = 0
+    admitted: int = 0
+    rejected: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    @property
+    def avg_wait(self) -> float:
+        return self.total_wait / self.admitted if self.admitted else 0.0
+
+
+class _ModelQueue:
+    """Concurrency cap for one model with a bounded, fair wait queue.
+
+    Waiters are grouped by chat and then by user, and slots are handed out
+    round-robin, so one busy chat or user can't starve everyone else.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int) -> None:
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.stats = QueueStats()
+        self._waiters: OrderedDict[int | None, OrderedDict[int, deque[asyncio.Future]]] = OrderedDict()
+
+    async def acquire(self, user_id: int, chat_id: int | None) -> None:
+        if self.stats.running < self.max_concurrency and self.stats.waiting == 0:
+            self.stats.running += 1
+            return
+
+        if self.stats.waiting >= self.max_queue:
+            self.stats.rejected += 1
+            raise QueueFullError
+
+        future = asyncio.get_running_loop().create_future()
+        chat_waiters = self._waiters.setdefault(chat_id, OrderedDict())
+        chat_waiters.setdefault(user_id, deque()).append(future)
+        self.stats.waiting += 1
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was already handed to us, pass it on
+                self.release()
+            else:
+                self._remove(future, user_id, chat_id)
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            future = self._pop_next()
+            if not future.done():
+                # The slot goes straight to the next waiter, `running` stays the same
+                future.set_result(None)
+                return
+        self.stats.running -= 1
+
+    def _pop_next(self) -> asyncio.Future:
+        chat_id, chat_waiters = next(iter(self._waiters.items()))
+        user_id, user_waiters = next(iter(chat_waiters.items()))
+
+        future = user_waiters.popleft()
+        self.stats.waiting -= 1
+
+        # Move the user and the chat to the back of the line
+        del chat_waiters[user_id]
+        if user_waiters:
+            chat_waiters[user_id] = user_waiters
+        del self._waiters[chat_id]
+        if chat_waiters:
+            self._waiters[chat_id] = chat_waiters
+        return future
+
+    def _remove(self, future: asyncio.Future, user_id: int, chat_id: int | None) -> None:
+        chat_waiters = self._waiters.get(chat_id)
+        if chat_waiters is None or user_id not in chat_waiters:
+            return
+
+        user_waiters = chat_waiters[user_id]
+        if future in user_waiters:
+            user_waiters.remove(future)
+            self.stats.waiting -= 1
+        if not user_waiters:
+            del chat_waiters[user_id]
+        if not chat_waiters:
+            del self._waiters[chat_id]
+
+
+class GenerationScheduler:
+    """Admission control in front of OpenRouter requests, one queue per model."""
+
+    def __init__(self) -> None:
+        self._queues: dict[str, _ModelQueue] = {}
+
+    def _get_queue(self, model: Model) -> _ModelQueue:
+        queue = self._queues.get(model.name)
+        if queue is None:
+            queue = _ModelQueue(
+                max_concurrency=model.max_concurrency or settings.generation_queue.max_concurrency,
+                max_queue=(
+                    model.max_queue if model.max_queue is not None
+                    else settings.generation_queue.max_queue
+                ),
+            )
+            self._queues[model.name] = queue
+        return queue
+
+    @asynccontextmanager
+    async def slot(self, model: Model, user_id: int, chat_id: int | None = None) -> AsyncIterator[None]:
+        """Waits for a free slot for the model. Raises `QueueFullError` if the queue is full."""
+        queue = self._get_queue(model)
+
+        started_at = time.monotonic()
+        await queue.acquire(user_id, chat_id)
+        waited = time.monotonic() - started_at
+
+        queue.stats.admitted += 1
+        queue.stats.total_wait += waited
+        queue.stats.max_wait = max(queue.stats.max_wait, waited)
+        if waited > 0.01:
+            logger.info(
+                f"Waited {waited:.2f}s for {model.name}"
+                f" ({queue.stats.running} running, {queue.stats.waiting} waiting)"
+            )
+
+        try:
+            yield
+        finally:
+            queue.release()
+
+    def stats(self) -> dict[str, QueueStats]:
+        """Returns queue depth and wait time for every model that was used."""
+        return {name: queue.stats for name, queue in self._queues.items()}
+
+
+scheduler = GenerationScheduler()
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+import orjson
+from loguru import logger
+
+OnDelta = Callable[[str], Awaitable[None]]
+
+
+def build_request_key(model: str, messages: list[dict] | None, prompt: str | None) -> str:
+    """Build a key that is the same only for requests that render to the same prompt."""
+    payload = orjson.dumps([model, messages, prompt])
+    return hashlib.sha256(payload).hexdigest()
+
+
+class _Subscriber:
+    def __init__(self, on_delta: OnDelta) -> None:
+        self.on_delta = on_delta
+        # Keeps replayed and live deltas in order
+        self.lock = asyncio.Lock()
+
+    async def send(self, delta: str) -> None:
+        async with self.lock:
+            await self.on_delta(delta)
+
+
+@dataclass
+class _Call:
+    deltas: list[str] = field(default_factory=list)
+    subscribers: list[_Subscriber] = field(default_factory=list)
+    task: asyncio.Task | None = None
+
+    async def publish(self, delta: str) -> None:
+        self.deltas.append(delta)
+        for subscriber in list(self.subscribers):
+            try:
+                await subscriber.send(delta)
+            except Exception as e:
+                logger.warning(f"Dropping a stream subscriber: {e}")
+                self.subscribers.remove(subscriber)
+
+
+@dataclass
+class SingleFlightStats:
+    leaders: int = 0
+    followers: int = 0
+
+
+class SingleFlight:
+    """Lets concurrent identical calls share one execution.
+
+    The first caller of a key runs the function, everyone who comes with the same key
+    while it's running waits for the same result. Streamed deltas are fanned out to
+    every caller, late callers get what was already streamed first.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[str, _Call] = {}
+        self.stats = SingleFlightStats()
+
+    async def do(
+        self,
+        key: str,
+        func: Callable[[OnDelta | None], Awaitable[Any]],
+        on_delta: OnDelta | None = None,
+    ) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call()
+            self._calls[key] = call
+            call.task = asyncio.create_task(
+                func(call.publish if on_delta is not None else None)
+            )
+            call.task.add_done_callback(lambda _: self._calls.pop(key, None))
+            self.stats.leaders += 1
+        else:
+            self.stats.followers += 1
+            logger.info(f"Joined an in-flight request {key[:12]}")
+
+        if on_delta is not None:
+            subscriber = _Subscriber(on_delta)
+            replay = "".join(call.deltas)
+            call.subscribers.append(subscriber)
+            if replay:
+                await subscriber.send(replay)
+
+        assert call.task is not None
+        # A caller going away must not cancel the request for everyone else
+        return await asyncio.shield(call.task)
+
+
+singleflight = SingleFlight()
@@ -0,0 +1,162 @@
+"""Saves generations in the background, so replies don't wait for the database.
+
+Handlers put records in a bounded queue, and one task writes them in batches:
+a batch is written once it has `batch_size` records or `batch_interval`
+seconds after its first one, in a single transaction with one executemany.
+If the database rejects a batch, its records are saved one by one, so only the
+bad ones are dropped.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Literal
+
+from loguru import logger
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.core.config import settings
+from bot.database.database import sessionmaker
+from bot.services.generations import GenerationRecord, LostRecord, add_generations
+
+WRITE_ATTEMPTS = 3
+# Drops are logged at most this often, there can be a lot of them at once
+DROP_LOG_INTERVAL = 10
+
+
+@dataclass
+class WriterStats:
+    written: int = 0
+    batches: int = 0
+    dropped: int = 0
+    failed: int = 0
+
+    @property
+    def avg_batch(self) -> float:
+        return self.written / self.batches if self.batches else 0.0
+
+
+class GenerationWriter:
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        batch_size: int = 100,
+        batch_interval: float = 0.2,
+        max_queue: int = 10_000,
+        overflow: Literal["drop", "wait"] = "drop",
+    ) -> None:
+        self.sessionmaker = sessionmaker
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.overflow = overflow
+
+        self.stats = WriterStats()
+        self.queue: asyncio.Queue[GenerationRecord | LostRecord] = asyncio.Queue(max_queue)
+        self._task: asyncio.Task | None = None
+        self._dropped_logged_at = 0.0
+
+    async def add(self, generation: GenerationRecord | LostRecord) -> None:
+        """Queues the generation, waits only if the queue is full and `overflow` is "wait"."""
+        # Starts on the first generation if the startup hook didn't run
+        self.start()
+        if self.overflow == "wait":
+            await self.queue.put(generation)
+            return
+
+        try:
+            self.queue.put_nowait(generation)
+        except asyncio.QueueFull:
+            self.stats.dropped += 1
+            if time.monotonic() - self._dropped_logged_at > DROP_LOG_INTERVAL:
+                self._dropped_logged_at = time.monotonic()
+                logger.warning(
+                    f"Generation queue is full ({self.queue.maxsize}), dropped {self.stats.dropped} generations so far"
+                )
+
+    async def _collect(self) -> list[GenerationRecord | LostRecord]:
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.batch_interval
+        while len(batch) < self.batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                async with asyncio.timeout(remaining):
+                    batch.append(await self.queue.get())
+            except TimeoutError:
+                break
+        return batch
+
+    async def _write(self, batch: list[GenerationRecord | LostRecord]) -> None:
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                async with self.sessionmaker() as session:
+                    await add_generations(session, batch)
+            except IntegrityError as e:
+                # A bad record, e.g. of a user deleted while it was queued, fails the whole batch
+                if len(batch) == 1:
+                    self.stats.failed += 1
+                    logger.error(f"Couldn't save a generation of user {batch[0].user_id}: {e}")
+                    return
+                logger.warning(f"Couldn't save {len(batch)} generations at once, saving them one by one: {e}")
+                for generation in batch:
+                    await self._write([generation])
+                return
+            except SQLAlchemyError as e:
+                if attempt == WRITE_ATTEMPTS:
+                    self.stats.failed += len(batch)
+                    logger.error(f"Couldn't save {len(batch)} generations: {e}")
+                    return
+                logger.warning(f"Couldn't save {len(batch)} generations, retrying: {e}")
+                await asyncio.sleep(0.5 * attempt)
+            except Exception as e:
+                self.stats.failed += len(batch)
+                logger.exception(f"Couldn't save {len(batch)} generations: {e}")
+                return
+            else:
+                self.stats.written += len(batch)
+                self.stats.batches += 1
+                return
+
+    async def run(self) -> None:
+        while True:
+            batch = await self._collect()
+            try:
+                # Shielded, so shutting down doesn't cut a batch in the middle of a write
+                await asyncio.shield(self._write(batch))
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def close(self, timeout: float = 10) -> None:
+        """Writes everything that's queued, giving up after `timeout` seconds."""
+        if self._task is None:
+            return
+        try:
+            async with asyncio.timeout(timeout):
+                await self.queue.join()
+        except TimeoutError:
+            logger.error(f"Gave up saving {self.queue.qsize()} generations on shutdown")
+        self._task.cancel()
+        self._task = None
+        logger.info(
+            f"Generation writer stopped: {self.stats}, {self.stats.avg_batch:.1f} generations per batch"
+        )
+
+
+generation_writer = GenerationWriter(
+    sessionmaker,
+    batch_size=settings.DB_WRITE_BATCH_SIZE,
+    batch_interval=settings.DB_WRITE_BATCH_INTERVAL,
+    max_queue=settings.DB_WRITE_QUEUE_SIZE,
+    overflow=settings.DB_WRITE_OVERFLOW,
+)
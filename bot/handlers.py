@@ -1,19 +1,26 @@
+import math
+from collections.abc import Callable
+from dataclasses import asdict
 from typing import Literal, overload
 
 from loguru import logger
 from telegrinder.types import InlineKeyboardMarkup
 
-from bot import ai_stuff
-from bot.base import Conversation, Message, Prompt, UserInfo
-from bot.core.config import HELP_MSG, OPENROUTER_HEADERS, Model, settings
+from bot.base import Conversation, Message, Prompt, RenderedPrompt, UserInfo
+from bot.core.config import HELP_MSG, Model, settings
 from bot.database.database import sessionmaker
 from bot.database.models import MoodModel, UserModel
-from bot.services.generations import add_generation, count_generations
+from bot.generation.breaker import CircuitOpenError, breaker
+from bot.generation.pipeline import generate
+from bot.generation.ratelimit import RateLimited, rate_limiter
+from bot.generation.scheduler import QueueFullError
+from bot.generation.writer import generation_writer
+from bot.services.generations import GenerationRecord, LostRecord, count_generations
 from bot.services.moods import (
     add_mood,
     get_all_moods,
     get_mood,
-    get_user_mood,
+    get_public_moods_page,
     remove_mood,
     set_user_mood,
     update_mood_value,
@@ -21,7 +28,7 @@ from bot.services.moods import (
 from bot.services.users import (
     add_user,
     get_user,
-    get_user_model,
+    get_user_context,
     remove_user,
     set_user_model,
     update_user_value,
@@ -29,6 +36,7 @@ from bot.services.users import (
 )
 from bot.tg import keyboards_tg
 from bot.utils import (
+    StreamCensor,
     censor_result,
     find_model_by_id,
     find_model_by_request,
@@ -61,16 +69,42 @@ def handle_help() -> str:
     return HELP_MSG
 
 
+def rate_limited_message(limited: RateLimited, model: Model | None = None) -> str:
+    wait = f"{math.ceil(limited.retry_after)} сек."
+    if limited.scope == "chat":
+        return f"{settings.emojis.system} В этом чате слишком много запросов к боту. Попробуйте ещё раз через {wait}"
+    if limited.scope == "price" and model is not None:
+        return (
+            f"{settings.emojis.system} Запросы к модели {model.name} закончились. Попробуйте ещё раз"
+            f" через {wait} или выберите модель подешевле в списке \"!модели\""
+        )
+    return f"{settings.emojis.system} Вы отправляете запросы слишком часто. Попробуйте ещё раз через {wait}"
+
+
 async def handle_ai(
     query: str,
     user: UserInfo,
     bot_id: str,
+    platform: str,
     reply_user: UserInfo | None = None,
     reply_query: str | None = None,
+    on_partial: Callable[[str], None] | None = None,
+    chat_id: int | None = None,
 ):
+    """Generates a reply to the user's query.
+
+    If `on_partial` is passed, the response is streamed and `on_partial` is called
+    with the censored text generated so far.
+    """
+    # Spam is turned away before it costs anything
+    limited = await rate_limiter.check(platform, user.user_id, chat_id)
+    if limited:
+        return rate_limited_message(limited)
+
     async with sessionmaker() as session:
-        db_user = await get_user(session, user.user_id)
-        if not db_user:
+        # Everything we need about the user in one cache entry or one query
+        user_context = await get_user_context(session, user.user_id)
+        if not user_context:
             return (
                 f"{settings.emojis.system} У вас нет аккаунта! Аккаунт в этом боте можно создать,"
                 " написав команду \"!начать\""
@@ -99,11 +133,11 @@ async def handle_ai(
 
         conversation_text = conv.render(incl_full_name=False)
 
-        user_model = await get_user_model(session, user.user_id)
+        user_model = user_context.model
         if user_model is None:
             logger.warning(f"User {user.user_id}'s model doesn't exist anymore, fallback to default")
 
-            default_model = find_model_by_id(settings.models, settings.default_model_id)
+            default_model = find_model_by_id(settings.default_model_id)
             if default_model is None:
                 default_model = Model(id="0", name="???")
 
@@ -125,23 +159,21 @@ async def handle_ai(
                     " модели можно командой \"!модели\""
                     )
 
+        limited = await rate_limiter.check_model(platform, user.user_id, user_model)
+        if limited:
+            return rate_limited_message(limited, user_model)
 
         fail_reason = await moderate_query(conversation_text)
         if fail_reason:
             return fail_reason
 
-        try:
-            user_mood = await get_user_mood(session, user.user_id)
-        except TypeError:
-            # User is a group or he doesn't have an account
-            # Defaulting to assistant mood
-            user_mood = await get_mood(session, 0)
-
+        # Defaults to the assistant mood if the user's one was removed
+        user_mood = user_context.prompt_mood
         if user_mood is None:
             raise ValueError("Couldn't find specified mood or assistant mood.")
 
         user_mood_instr = user_mood.instructions
-        user_persona  = db_user.persona
+        user_persona  = user_context.persona
 
     system_prompt = await process_main_prompt(
         system_prompt=settings.prompts.system_bot,
@@ -157,16 +189,39 @@ async def handle_ai(
         convo=conv
     )
 
-    messages_rendered = None
-    prompt_rendered = None
-    if user_model.source == 'bot' and user_model.template:
-        prompt_rendered = await prompt.full_render_template(bot_id, user_model.template)
-    else:
-        messages_rendered = prompt.full_render(bot_id)
+    async def render(model: Model) -> RenderedPrompt:
+        return await prompt.render_for(bot_id, model)
 
-    result = await ai_stuff.create_response(
-        OPENROUTER_HEADERS, settings.OPENAI_BASE_URL, messages_rendered, prompt_rendered, model_name
-    )
+    on_delta = None
+    if on_partial is not None and settings.streaming.enabled:
+        stream_censor = StreamCensor()
+        streamed = visible = ""
+
+        async def on_delta(delta: str) -> None:
+            nonlocal streamed, visible
+            streamed += delta
+            visible += stream_censor.feed(delta)
+            if visible.strip():
+                on_partial(visible.strip())
+
+    try:
+        result = await generate(user_model, render, user.user_id, chat_id, on_delta)
+    except QueueFullError:
+        return (
+            f"{settings.emojis.system} Сейчас к модели {user_model.name} слишком много запросов."
+            " Попробуйте ещё раз через минуту."
+        )
+    except CircuitOpenError:
+        return (
+            f"{settings.emojis.system} Модель {user_model.name} сейчас недоступна. Попробуйте"
+            " ещё раз через пару минут или выберите другую модель в списке \"!модели\""
+        )
+
+    # Hedged requests that lost to the answer are paid for as well
+    for lost_model, lost_usage in (result or {}).get("lost", []):
+        await generation_writer.add(
+            LostRecord(user_id=user.user_id, model=lost_model, mood_id=user_mood.id, cost=lost_usage.cost)
+        )
 
     if not result:
         return (
@@ -180,16 +235,24 @@ async def handle_ai(
 
 
     response = result["response"]
-    async with sessionmaker() as session:
-        await add_generation(
-            session,
-            response,
-            user.user_id,
-            model_name,
-            user_mood.id
+    # Saved in the background, the reply doesn't wait for the database
+    await generation_writer.add(
+        GenerationRecord(
+            response=response,
+            user_id=user.user_id,
+            # A fallback model could've answered instead of the user's one
+            model=result.get("model", model_name),
+            mood_id=user_mood.id,
+            **(asdict(result["usage"]) if result.get("usage") else {}),
         )
+    )
 
-    cens_response = censor_result(response).strip()
+    # A request joined without streaming could've sent nothing
+    if on_delta is not None and streamed == response:
+        # The stream was censored as it came, only the held back tail is left
+        cens_response = (visible + stream_censor.flush()).strip()
+    else:
+        cens_response = censor_result(response).strip()
 
     return cens_response
 
@@ -201,7 +264,8 @@ async def handle_settings(user_id: int, reply_user_id: int | None = None) -> tup
         admin_invoke = True
 
     async with sessionmaker() as session:
-        if not (await user_exists(session, user_id)):
+        user_context = await get_user_context(session, user_id)
+        if not user_context:
             if admin_invoke:
                 return (
                     f"{settings.emojis.system} У этого юзера нету аккаунта! Создать он его может командой \"!начать\"",
@@ -213,7 +277,7 @@ async def handle_settings(user_id: int, reply_user_id: int | None = None) -> tup
                     False
                 )
 
-        user_mood = await get_user_mood(session, user_id)
+        user_mood, user_model = user_context.mood, user_context.model
         logger.info(user_mood)
         if not user_mood:
             mood_id = 727727  # yup, that's osu! reference
@@ -223,7 +287,6 @@ async def handle_settings(user_id: int, reply_user_id: int | None = None) -> tup
             mood_id = user_mood.id
             mood_name = user_mood.name
 
-        user_model = await get_user_model(session, user_id)
     if not user_model:
         user_model = Model(id="0", name="???")
 
@@ -236,6 +299,9 @@ async def handle_settings(user_id: int, reply_user_id: int | None = None) -> tup
         model_name = user_model.id
 
     current_model_string = (f"{user_model.display_name} ({model_name})" if user_model.display_name else model_name)
+    model_health = (await breaker.status([user_model.name]))[user_model.name]
+    if model_health.state == "open":
+        current_model_string += " ⛔ (сейчас недоступна)"
 
     msg = ""
     if admin_invoke:
@@ -250,11 +316,7 @@ async def handle_settings(user_id: int, reply_user_id: int | None = None) -> tup
 
 async def handle_mood_list() -> str:
     async with sessionmaker() as session:
-        moods = await get_all_moods(
-            session, public_only=True, sort_by_popularity=True
-        )
-
-    moods = moods[:10]
+        moods = await get_public_moods_page(session, limit=10)
 
     if len(moods) == 0:
         return f"{settings.emojis.system} Публичных мудов в боте пока не существует!"
@@ -264,24 +326,50 @@ async def handle_mood_list() -> str:
         all_moods_str += f"\n• {mood[0].name} (id: {mood[0].id}){' - 👀 '+str(mood[1]) if mood[1] > 0 else ''}"
     return all_moods_str
 
+MOODS_PER_PAGE = 15
+# Neither SQLite nor PostgreSQL take bigger integers
+MAX_CURSOR = 2**63
+
+
+def parse_mood_cursor(value: object) -> tuple[int, int] | None:
+    """Reads a (popularity, mood id) cursor sent back by a keyboard, None if it isn't one."""
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        return None
+    if not all(type(item) is int and -MAX_CURSOR <= item < MAX_CURSOR for item in value):
+        return None
+    return (value[0], value[1])
+
+
 @overload
-async def handle_mood_page(offset: int, platform: Literal["vk"]) -> str | tuple[str, str]: ...
+async def handle_mood_page(
+    platform: Literal["vk"], after: tuple[int, int] | None = None, before: tuple[int, int] | None = None
+) -> str | tuple[str, str]: ...
 @overload
-async def handle_mood_page(offset: int, platform: Literal["tg"]) -> str | tuple[str, InlineKeyboardMarkup]: ...
-
-async def handle_mood_page(offset: int, platform: str) -> str | tuple[str, str | InlineKeyboardMarkup]:
+async def handle_mood_page(
+    platform: Literal["tg"], after: tuple[int, int] | None = None, before: tuple[int, int] | None = None
+) -> str | tuple[str, InlineKeyboardMarkup]: ...
+
+async def handle_mood_page(
+    platform: str, after: tuple[int, int] | None = None, before: tuple[int, int] | None = None
+) -> str | tuple[str, str | InlineKeyboardMarkup]:
+    """Shows public moods by popularity, the page after or before a (popularity, mood id) cursor."""
     async with sessionmaker() as session:
-        moods = await get_all_moods(
-            session, public_only=True, sort_by_popularity=True
-        )
+        # One more mood than fits on the page tells whether there's another page past it
+        moods = await get_public_moods_page(session, MOODS_PER_PAGE + 1, after=after, before=before)
+        if not moods and (after or before):
+            # Moods around the cursor got deleted or hidden, start over
+            after = before = None
+            moods = await get_public_moods_page(session, MOODS_PER_PAGE + 1)
 
     if len(moods) == 0:
         return f"{settings.emojis.system} Публичных мудов в боте пока не существует!"
 
-    if offset < 0:
-        offset = 0
-
-    new_moods = moods[offset:offset+15]
+    if before is not None:
+        has_left, has_right = len(moods) > MOODS_PER_PAGE, True
+        new_moods = moods[-MOODS_PER_PAGE:]
+    else:
+        has_left, has_right = after is not None, len(moods) > MOODS_PER_PAGE
+        new_moods = moods[:MOODS_PER_PAGE]
 
     match platform:
         case "vk":
@@ -291,7 +379,11 @@ async def handle_mood_page(offset: int, platform: str) -> str | tuple[str, str |
         case _:
             raise TypeError(f"Unknown platform passed: {platform}")
 
-    kbd = kbd_page_generator(has_left=(offset > 0), has_right=(len(moods[offset+15:]) > 0), offset=offset)
+    first, last = new_moods[0], new_moods[-1]
+    kbd = kbd_page_generator(
+        before=(first[1], first[0].id) if has_left else None,
+        after=(last[1], last[0].id) if has_right else None,
+    )
 
     all_moods_str = ""
     for mood in new_moods:
@@ -508,6 +600,8 @@ async def handle_my_persona(user_id: int) -> str:
 
 
 async def handle_models_list(cp: str = "!") -> str:
+    models_health = await breaker.status([model.name for model in settings.models])
+
     msg = f"{settings.emojis.system} Вот все текущие доступные модели бота:"
     for model in settings.models:
         if model.price > 0:
@@ -522,6 +616,9 @@ async def handle_models_list(cp: str = "!") -> str:
         if model.deprecation and model.deprecation.warning:
             # Model will become deprecated soon
             new_msg += " ⚠️"
+        if models_health[model.name].state == "open":
+            # Circuit breaker is open, requests to the model fail instantly
+            new_msg += " ⛔ недоступна"
 
         msg += new_msg
 
@@ -562,7 +659,7 @@ async def handle_set_model(user_id: int, model_string: str) -> str | None:
         model_name = None
         model_openrouter_id = None
         if not is_custom:
-            selected_model: Model | None = find_model_by_id(settings.models, model_string)
+            selected_model: Model | None = find_model_by_id(model_string)
             if selected_model is None:
                 return f"{settings.emojis.system} Модели с таким айди пока не существует!"
 
@@ -1,33 +1,60 @@
-from sqlalchemy import func, select
+import datetime
+from collections import Counter
+from collections.abc import Sequence
+from dataclasses import asdict, dataclass
+
+from sqlalchemy import bindparam, cast, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from bot.cache.redis import build_key, cached, clear_cache
-from bot.database.models import GenerationsModel
+from bot.cache.redis import TAGGED_TTL, build_key, cached, invalidate_tags
+from bot.database.models import GenerationsModel, MoodStatsModel, UsageDailyModel
 
+# Columns of `UsageDailyModel` that are added up
+USAGE_SUMS = (
+    "generations", "metered", "prompt_tokens", "completion_tokens", "cost", "latency_ms", "ttft_ms",
+    "lost", "lost_cost",
+)
+# Those that are the usage of a generation itself
+GENERATION_USAGE = ("prompt_tokens", "completion_tokens", "cost", "latency_ms", "ttft_ms")
+USAGE_GROUPS = ("day", "model", "mood_id")
 
-async def add_generation(
-    session: AsyncSession,
-    response: str,
-    user_id: int,
-    model: str,
-    mood_id: int,
-) -> int:
-    """Add a new mood to the database."""
-    new_gen = GenerationsModel(
-        response=response,
-        user_id=user_id,
-        model=model,
-        mood_id=mood_id,
-    )
 
-    session.add(new_gen)
-    await session.flush()
+def generation_tags(user_id: int | None = None, model: str | None = None, mood_id: int | None = None) -> list[str]:
+    """Tags of generation counts, a new generation touches the total and every filter it matches."""
+    tags = ["generations"]
+    if user_id is not None:
+        tags.append(f"generations:user:{user_id}")
+    if model is not None:
+        tags.append(f"generations:model:{model}")
+    if mood_id is not None:
+        tags.append(f"generations:mood:{mood_id}")
+    return tags
 
-    gen_id = new_gen.id
 
-    await session.commit()
-    await clear_cache(count_generations, gen_id)
-    return gen_id
+@dataclass(frozen=True, slots=True)
+class GenerationRecord:
+    response: str
+    user_id: int
+    model: str
+    mood_id: int
+    # Usage of the request, see `bot.ai_stuff.Usage`
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    latency_ms: int | None = None
+    ttft_ms: int | None = None
+    provider: str | None = None
+    cost: float | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class LostRecord:
+    """A hedged request that lost to another model's answer, only counted in the daily usage."""
+    user_id: int
+    model: str
+    mood_id: int
+    # None unless OpenRouter reported it before the request was cancelled
+    cost: float | None = None
 
 
 @cached(
@@ -35,7 +62,14 @@ async def add_generation(
         lambda session, user_id=None, model=None, mood_id=None: (
             build_key(user_id, model, mood_id)
         )
-    )
+    ),
+    ttl=TAGGED_TTL,
+    tags=(
+        lambda session, user_id=None, model=None, mood_id=None: (
+            # Unfiltered counts depend on every generation, filtered ones only on their filters
+            generation_tags(user_id, model, mood_id)[1:] or ["generations"]
+        )
+    ),
 )
 async def count_generations(
     session: AsyncSession,
@@ -43,6 +77,14 @@ async def count_generations(
     model: str | None = None,
     mood_id: int | None = None
 ) -> int:
+    if mood_id is not None and user_id is None and model is None:
+        result = await session.execute(
+            select(MoodStatsModel.generations).where(MoodStatsModel.mood_id == mood_id)
+        )
+        gen_count = result.scalar_one_or_none()
+        if gen_count is not None:
+            return gen_count
+
     query = select(func.count(GenerationsModel.id))
     if user_id is not None:
         query = query.filter(GenerationsModel.user_id == user_id)
@@ -56,3 +98,95 @@ async def count_generations(
     result = await session.execute(query)
     gen_count = result.scalar_one()
     return gen_count
+
+
+def usage_rollup(generations: list[GenerationRecord | LostRecord], day: datetime.date) -> list[dict]:
+    """Sums the usage of the generations and lost requests per model and mood."""
+    rows: dict[tuple[str, int], dict] = {}
+    for generation in generations:
+        row = rows.get((generation.model, generation.mood_id))
+        if row is None:
+            row = rows[generation.model, generation.mood_id] = {
+                "day": day, "model": generation.model, "mood_id": generation.mood_id,
+                **dict.fromkeys(USAGE_SUMS, 0),
+            }
+        if isinstance(generation, LostRecord):
+            row["lost"] += 1
+            row["lost_cost"] += generation.cost or 0
+            continue
+        row["generations"] += 1
+        row["metered"] += generation.latency_ms is not None
+        for column in GENERATION_USAGE:
+            row[column] += getattr(generation, column) or 0
+    return list(rows.values())
+
+
+async def add_usage(session: AsyncSession, rows: list[dict]) -> None:
+    """Adds the rows to the daily usage, creating the days that aren't there yet."""
+    dialect = postgresql if session.get_bind().dialect.name == "postgresql" else sqlite
+    query = dialect.insert(UsageDailyModel)
+    table = UsageDailyModel.__table__
+    await session.execute(
+        query.on_conflict_do_update(
+            index_elements=USAGE_GROUPS,
+            set_={column: table.c[column] + query.excluded[column] for column in USAGE_SUMS},
+        ),
+        rows,
+    )
+
+
+async def add_generations(session: AsyncSession, records: list[GenerationRecord | LostRecord]) -> None:
+    """Adds several generations in one transaction, along with their counters and usage.
+
+    Lost requests are only added to the usage.
+    """
+    generations = [record for record in records if isinstance(record, GenerationRecord)]
+    if generations:
+        await session.execute(insert(GenerationsModel), [asdict(generation) for generation in generations])
+
+        stats = MoodStatsModel.__table__
+        await session.execute(
+            update(stats)
+            .where(stats.c.mood_id == bindparam("b_mood_id"))
+            .values(generations=stats.c.generations + bindparam("b_count")),
+            [
+                {"b_mood_id": mood_id, "b_count": count}
+                for mood_id, count in Counter(generation.mood_id for generation in generations).items()
+            ],
+        )
+    await add_usage(session, usage_rollup(records, datetime.datetime.now(datetime.UTC).date()))
+    await session.commit()
+
+    tags = {
+        tag
+        for generation in generations
+        for tag in generation_tags(generation.user_id, generation.model, generation.mood_id)
+    }
+    if tags:
+        await invalidate_tags(*tags)
+
+
+async def get_usage(
+    session: AsyncSession,
+    since: datetime.date,
+    until: datetime.date | None = None,
+    group_by: Sequence[str] = ("day", "model"),
+) -> list[dict]:
+    """Usage summed over the days from `since` to `until` inclusive, grouped by any of `USAGE_GROUPS`."""
+    table = UsageDailyModel.__table__
+    groups = [table.c[column] for column in group_by]
+    query = (
+        select(
+            *groups,
+            # PostgreSQL sums big integers into numerics
+            *(cast(func.sum(table.c[column]), table.c[column].type).label(column) for column in USAGE_SUMS),
+        )
+        .where(table.c.day >= since)
+        .group_by(*groups)
+        .order_by(*groups)
+    )
+    if until is not None:
+        query = query.where(table.c.day <= until)
+
+    result = await session.execute(query)
+    return [dict(row._mapping) for row in result]
@@ -1,11 +1,14 @@
+import asyncio
 from typing import Literal, overload
 
-from sqlalchemy import delete, func, select, update
+from loguru import logger
+from sqlalchemy import delete, func, insert, select, tuple_, update
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from bot.cache.redis import build_key, cached, clear_cache
-from bot.database.models import GenerationsModel, MoodModel, UserModel
+from bot.cache.redis import DEFAULT_TTL, TAGGED_TTL, build_key, cached, invalidate_tags, invalidates
+from bot.core.config import settings
+from bot.database.models import GenerationsModel, MoodModel, MoodStatsModel, UserModel
 
 
 async def add_mood(
@@ -29,9 +32,11 @@ async def add_mood(
     await session.flush()
 
     mood_id = new_mood.id
+    session.add(MoodStatsModel(mood_id=mood_id))
 
     await session.commit()
-    await clear_cache(get_mood, mood_id)
+    # get_mood could've cached that there's no mood with this id
+    await invalidate_tags(f"mood:{mood_id}", "moods")
     return mood_id
 
 
@@ -49,6 +54,15 @@ async def add_default_mood(
         " languages except Russian, unless asked by user."
     )
 
+    if await session.get(MoodModel, 0) is not None:
+        return False
+
+    # PostgreSQL enforces foreign keys, so there the owner must exist before their mood.
+    # SQLite doesn't, and the owner shouldn't look registered before running !начать
+    owner_needed = session.get_bind().dialect.name != "sqlite"
+    if owner_needed and await session.get(UserModel, user_id) is None:
+        session.add(UserModel(id=user_id, platform="vk"))
+
     new_mood = MoodModel(
         id=0,
         user_id=user_id,
@@ -60,7 +74,11 @@ async def add_default_mood(
     session.add(new_mood)
 
     try:
+        # The counter isn't a relationship of the mood, so it could be inserted first
+        await session.flush()
+        session.add(MoodStatsModel(mood_id=0))
         await session.commit()
+        await invalidate_tags("mood:0", "moods", *([f"user:{user_id}"] if owner_needed else []))
         return True
     except IntegrityError:
         await session.rollback()
@@ -87,7 +105,12 @@ async def get_all_moods(
         lambda session, user_id=None, public_only=False, sort_by_popularity=False: (
             build_key(user_id, public_only, sort_by_popularity)
         )
-    )
+    ),
+    # Listings change with any mood, popularity changes with every generation,
+    # so the entries are short-lived and refreshed in the background
+    tags=lambda session, user_id=None, public_only=False, sort_by_popularity=False: ["moods"],
+    stale_ttl=30,
+    early_refresh=1.0,
 )
 async def get_all_moods(
     session: AsyncSession,
@@ -105,18 +128,11 @@ async def get_all_moods(
         query = query.filter_by(is_private=False)
 
     if sort_by_popularity:
-        popularity = func.count(GenerationsModel.id).label("popularity")
-
         # Select both MoodModel and popularity as a second column
         query = (
-            select(MoodModel, popularity)
-            .join(
-                GenerationsModel,
-                GenerationsModel.mood_id == MoodModel.id,
-                isouter=True
-            )
-            .group_by(MoodModel.id)
-            .order_by(popularity.desc())
+            query.add_columns(MoodStatsModel.generations)
+            .join(MoodStatsModel, MoodStatsModel.mood_id == MoodModel.id)
+            .order_by(MoodStatsModel.generations.desc(), MoodStatsModel.mood_id.desc())
         )
 
         result = await session.execute(query)
@@ -128,7 +144,69 @@ async def get_all_moods(
     return list(moods)
 
 
-@cached(key_builder=lambda session, mood_id: build_key(mood_id))
+async def get_public_moods_page(
+    session: AsyncSession,
+    limit: int,
+    after: tuple[int, int] | None = None,
+    before: tuple[int, int] | None = None,
+) -> list[tuple[MoodModel, int]]:
+    """Returns up to `limit` public moods with their popularity, the most popular first.
+
+    `after` and `before` are (popularity, mood id) of the moods on the edges of
+    the current page. The counters are read in the order of their index starting
+    from the cursor, so a page costs as much as its size however far it is.
+    """
+    # Cursors come from users and could be anything, so only the first page is cached
+    if after is None and before is None:
+        return await get_first_public_moods_page(session, limit)
+    return await _get_public_moods_page(session, limit, after, before)
+
+
+@cached(
+    key_builder=lambda session, limit: build_key(limit),
+    tags=lambda session, limit: ["moods"],
+    stale_ttl=30,
+    early_refresh=1.0,
+)
+async def get_first_public_moods_page(session: AsyncSession, limit: int) -> list[tuple[MoodModel, int]]:
+    """Returns the most popular public moods, where every listing starts."""
+    return await _get_public_moods_page(session, limit)
+
+
+async def _get_public_moods_page(
+    session: AsyncSession,
+    limit: int,
+    after: tuple[int, int] | None = None,
+    before: tuple[int, int] | None = None,
+) -> list[tuple[MoodModel, int]]:
+    popularity = MoodStatsModel.generations
+    position = tuple_(popularity, MoodStatsModel.mood_id)
+    query = (
+        select(MoodModel, popularity)
+        .join(MoodStatsModel, MoodStatsModel.mood_id == MoodModel.id)
+        .where(MoodModel.is_private.is_(False))
+        .limit(limit)
+    )
+
+    if before is not None:
+        # Walk back from the cursor, then put the page in the usual order
+        query = query.where(position > tuple_(*before)).order_by(popularity, MoodStatsModel.mood_id)
+        result = await session.execute(query)
+        return [(row[0], row[1]) for row in reversed(result.all())]
+
+    if after is not None:
+        query = query.where(position < tuple_(*after))
+    query = query.order_by(popularity.desc(), MoodStatsModel.mood_id.desc())
+    result = await session.execute(query)
+    return [(row[0], row[1]) for row in result.all()]
+
+
+@cached(
+    ttl=TAGGED_TTL,
+    key_builder=lambda session, mood_id: build_key(mood_id),
+    local_ttl=DEFAULT_TTL,
+    tags=lambda session, mood_id: [f"mood:{mood_id}"],
+)
 async def get_mood(
     session: AsyncSession, mood_id: int
 ) -> MoodModel | None:
@@ -141,15 +219,19 @@ async def get_mood(
     return user
 
 
+@invalidates(lambda session, mood_id: [f"mood:{mood_id}", "moods"])
 async def remove_mood(
     session: AsyncSession, mood_id: int
 ) -> None:
     """Removes a model from the database."""
     query = delete(MoodModel).where(MoodModel.id == mood_id)
     await session.execute(query)
+    # SQLite doesn't enforce foreign keys, so the counter isn't removed with the mood
+    await session.execute(delete(MoodStatsModel).where(MoodStatsModel.mood_id == mood_id))
     await session.commit()
 
 
+@invalidates(lambda session, mood_id, key, value: [f"mood:{mood_id}", "moods"])
 async def update_mood_value(session: AsyncSession, mood_id: int, key, value) -> None:
     stmt = update(MoodModel).where(MoodModel.id == mood_id).values({key: value})
 
@@ -157,32 +239,68 @@ async def update_mood_value(session: AsyncSession, mood_id: int, key, value) ->
     await session.commit()
 
 
+@invalidates(lambda session, user_id, mood_id: [f"user:{user_id}"])
 async def set_user_mood(session: AsyncSession, user_id: int, mood_id: int) -> None:
     query = update(UserModel).where(UserModel.id == user_id).values(current_mood_id=mood_id)
 
     await session.execute(query)
     await session.commit()
-    await clear_cache(get_user_mood, user_id)
 
 
-@cached(key_builder=lambda session, user_id: build_key(user_id))
-async def get_user_mood(session: AsyncSession, user_id: int) -> MoodModel | None:
-    """Returns user's current mood
+async def reconcile_mood_stats(session: AsyncSession) -> int:
+    """Recounts generations of every mood, returns how many counters were wrong.
 
-    Args:
-        session (AsyncSession): SQLAlchemy asynchronous session
-        user_id (int): user's id
-
-    Returns:
-        MoodModel | None: MoodModel or nothing
+    On PostgreSQL a generation saved while a counter is being recounted can be
+    left out of it, the recount reads the generations as they were when it started.
+    The counter is then one short until the next pass.
     """
-    query = select(UserModel.current_mood_id).filter_by(id=user_id).limit(1)
-    result = await session.execute(query)
-    mood_id = result.scalar_one_or_none()
-    if mood_id is None:
-        return
+    generations = (
+        select(func.count(GenerationsModel.id))
+        .where(GenerationsModel.mood_id == MoodStatsModel.mood_id)
+        .scalar_subquery()
+    )
+    fixed = await session.execute(
+        update(MoodStatsModel).where(MoodStatsModel.generations != generations).values(generations=generations)
+    )
+    # Moods created by older versions or added past `add_mood`
+    missing = await session.execute(
+        insert(MoodStatsModel).from_select(
+            ["mood_id", "generations"],
+            select(
+                MoodModel.id,
+                select(func.count(GenerationsModel.id))
+                .where(GenerationsModel.mood_id == MoodModel.id)
+                .scalar_subquery(),
+            ).where(MoodModel.id.not_in(select(MoodStatsModel.mood_id))),
+        )
+    )
+    await session.execute(delete(MoodStatsModel).where(MoodStatsModel.mood_id.not_in(select(MoodModel.id))))
+    await session.commit()
 
-    query = select(MoodModel).filter_by(id=mood_id).limit(1)
-    result = await session.execute(query)
-    mood = result.scalar_one_or_none()
-    return mood
\ No newline at end of file
+    count = fixed.rowcount + missing.rowcount
+    if count:
+        await invalidate_tags("moods", "generations")
+    return count
+
+
+async def reconcile_mood_stats_periodically(
+    sessionmaker: async_sessionmaker[AsyncSession], interval: float
+) -> None:
+    """Runs `reconcile_mood_stats` right away and then every `interval` seconds."""
+    while True:
+        try:
+            async with sessionmaker() as session:
+                fixed = await reconcile_mood_stats(session)
+            if fixed:
+                logger.warning(f"Fixed {fixed} mood popularity counters")
+        except Exception as e:
+            logger.exception(f"Couldn't reconcile mood popularity counters: {e}")
+        await asyncio.sleep(interval)
+
+
+def start_mood_stats_reconciler(sessionmaker: async_sessionmaker[AsyncSession]) -> asyncio.Task | None:
+    if not settings.MOOD_STATS_RECONCILE_INTERVAL:
+        return None
+    return asyncio.create_task(
+        reconcile_mood_stats_periodically(sessionmaker, settings.MOOD_STATS_RECONCILE_INTERVAL)
+    )
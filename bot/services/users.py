@@ -1,12 +1,41 @@
-from sqlalchemy import delete, select, update
+from dataclasses import dataclass
+
+from sqlalchemy import delete, or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from bot.cache.redis import build_key, cached, clear_cache
-from bot.core.config import Model, settings
-from bot.database.models import UserModel
+from bot.cache.redis import DEFAULT_TTL, TAGGED_TTL, build_key, cached, invalidate_tags, invalidates
+from bot.cache.serialization import RecordSerializer
+from bot.core.config import Model
+from bot.database.models import MoodModel, UserModel
 from bot.utils import find_model_by_id, find_model_by_request
 
 
+@dataclass(frozen=True)
+class UserContext:
+    """Everything the handlers need about a user to answer them.
+
+    The user and the moods are read-only records with the columns of
+    `UserModel` and `MoodModel`, not ORM rows, as the context always comes from the cache.
+    """
+    user: UserModel
+    # None if the model was removed from the config or from OpenRouter
+    model: Model | None
+    # None if the mood was removed
+    mood: MoodModel | None
+    # The assistant mood, only loaded when the user's mood is missing
+    default_mood: MoodModel | None = None
+
+    @property
+    def persona(self) -> str:
+        return self.user.persona
+
+    @property
+    def prompt_mood(self) -> MoodModel | None:
+        """The mood to answer with."""
+        return self.mood or self.default_mood
+
+
+@invalidates(lambda session, user_id, platform: [f"user:{user_id}"])
 async def add_user(
     session: AsyncSession, user_id: int, platform: str
 ) -> None:
@@ -18,11 +47,14 @@ async def add_user(
 
     session.add(new_user)
     await session.commit()
-    await clear_cache(get_user, user_id)
-    await clear_cache(user_exists, user_id)
 
 
-@cached(key_builder=lambda session, user_id: build_key(user_id))
+@cached(
+    ttl=TAGGED_TTL,
+    key_builder=lambda session, user_id: build_key(user_id),
+    local_ttl=DEFAULT_TTL,
+    tags=lambda session, user_id: [f"user:{user_id}"],
+)
 async def get_user(
     session: AsyncSession, user_id: int
 ) -> UserModel | None:
@@ -35,7 +67,12 @@ async def get_user(
     return user
 
 
-@cached(key_builder=lambda session, user_id: build_key(user_id))
+@cached(
+    ttl=TAGGED_TTL,
+    key_builder=lambda session, user_id: build_key(user_id),
+    local_ttl=DEFAULT_TTL,
+    tags=lambda session, user_id: [f"user:{user_id}"],
+)
 async def user_exists(session: AsyncSession, user_id: int) -> bool:
     """Checks if the user is in the database."""
     query = select(UserModel.id).filter_by(id=user_id).limit(1)
@@ -50,11 +87,15 @@ async def remove_user(
     session: AsyncSession, user_id: int
 ) -> None:
     """Removes user from the database."""
+    # PostgreSQL deletes their moods along with them, so those are dropped from the cache too
+    mood_ids = (await session.execute(select(MoodModel.id).filter_by(user_id=user_id))).scalars().all()
     query = delete(UserModel).where(UserModel.id == user_id)
     await session.execute(query)
     await session.commit()
+    await invalidate_tags(f"user:{user_id}", "moods", *(f"mood:{mood_id}" for mood_id in mood_ids))
 
 
+@invalidates(lambda session, user_id, key, value: [f"user:{user_id}"])
 async def update_user_value(session: AsyncSession, user_id: int, key, value) -> None:
     stmt = update(UserModel).where(UserModel.id == user_id).values({key: value})
 
@@ -62,29 +103,55 @@ async def update_user_value(session: AsyncSession, user_id: int, key, value) ->
     await session.commit()
 
 
+@invalidates(lambda session, user_id, model_string: [f"user:{user_id}"])
 async def set_user_model(session: AsyncSession, user_id: int, model_string: str) -> None:
     query = update(UserModel).where(UserModel.id == user_id).values(current_model_id=model_string)
 
     await session.execute(query)
     await session.commit()
-    await clear_cache(get_user_model, user_id)
-
-
-@cached(key_builder=lambda session, user_id: build_key(user_id))
-async def get_user_model(session: AsyncSession, user_id: int) -> Model | None:
-    """Return user's current model."""
-    query = select(UserModel.current_model_id).filter_by(id=user_id).limit(1)
 
-    result = await session.execute(query)
 
-    model_id = result.scalar_one()
+async def resolve_model(model_id: str | None) -> Model | None:
+    """Finds the model by the id stored in `UserModel.current_model_id`."""
     if not model_id:
         return
     elif model_id.isdigit():
-        model = find_model_by_id(settings.models, model_id)
+        model = find_model_by_id(model_id)
         return model
     else:
         model = await find_model_by_request(model_id)
         if model:
             model.source = "openrouter"
         return model
+
+
+# The user's mood can be edited by its author, so any mood change drops the context too
+@cached(
+    ttl=TAGGED_TTL,
+    key_builder=lambda session, user_id: build_key(user_id),
+    local_ttl=DEFAULT_TTL,
+    tags=lambda session, user_id: [f"user:{user_id}", "moods"],
+    serializer=RecordSerializer(dataclasses=(UserContext,)),
+)
+async def get_user_context(session: AsyncSession, user_id: int) -> UserContext | None:
+    """Returns the user with their model and mood, None if they don't have an account."""
+    # Both the user's mood and the assistant one come in the same query, at most two rows
+    query = (
+        select(UserModel, MoodModel)
+        .outerjoin(MoodModel, or_(MoodModel.id == UserModel.current_mood_id, MoodModel.id == 0))
+        .filter(UserModel.id == user_id)
+    )
+    result = await session.execute(query)
+    rows = result.all()
+    if not rows:
+        return
+
+    user = rows[0][0]
+    moods = {mood.id: mood for _, mood in rows if mood is not None}
+    mood = moods.get(user.current_mood_id)
+    return UserContext(
+        user=user,
+        model=await resolve_model(user.current_model_id),
+        mood=mood,
+        default_mood=moods.get(0) if mood is None else None,
+    )
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import yaml
+from jinja2 import Template
+from jinja2.sandbox import ImmutableSandboxedEnvironment
+from loguru import logger
+
+from bot.core.config import BOT_DIR, settings
+
+
+@dataclass
+class _CompiledTemplate:
+    template: Template
+    mtime: float
+    checked_at: float
+
+
+class TemplateRegistry:
+    """Keeps every instruction template compiled in memory.
+
+    Templates are loaded from `path` once and reloaded only when the mtime of
+    their file changes. Files are checked at most once per `check_interval` seconds.
+    """
+
+    def __init__(self, path: str | Path, check_interval: float = 1.0) -> None:
+        path = Path(path)
+        if not path.is_absolute() and not path.exists():
+            # The path in the config is relative to the bot's package
+            path = BOT_DIR / path
+        self.path = path
+        self.check_interval = check_interval
+
+        self._env = ImmutableSandboxedEnvironment(trim_blocks=True, lstrip_blocks=True)
+        self._templates: dict[str, _CompiledTemplate] = {}
+        self._loaded_all = False
+
+    def load_all(self) -> None:
+        """Loads and compiles every template in the folder."""
+        for file in self.path.glob("*.yaml"):
+            self._load(file.stem)
+        self._loaded_all = True
+        logger.info(f"Loaded {len(self._templates)} instruction templates from {self.path}")
+
+    def get(self, name: str) -> Template:
+        if not self._loaded_all:
+            self.load_all()
+
+        compiled = self._templates.get(name)
+        now = time.monotonic()
+        if compiled is None:
+            return self._load(name).template
+
+        if now - compiled.checked_at >= self.check_interval:
+            compiled.checked_at = now
+            if os.stat(self._file(name)).st_mtime != compiled.mtime:
+                logger.info(f"Instruction template {name} has changed, reloading it")
+                compiled = self._load(name)
+        return compiled.template
+
+    def _file(self, name: str) -> Path:
+        return self.path / f"{name}.yaml"
+
+    def _load(self, name: str) -> _CompiledTemplate:
+        file = self._file(name)
+        mtime = os.stat(file).st_mtime
+        with open(file, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f)
+
+        compiled = _CompiledTemplate(
+            template=self._env.from_string(data["instruction_template"]),
+            mtime=mtime,
+            checked_at=time.monotonic(),
+        )
+        self._templates[name] = compiled
+        return compiled
+
+
+template_registry = TemplateRegistry(settings.instruction_template_path)
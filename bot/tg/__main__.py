@@ -1,26 +1,54 @@
+import asyncio
+
 from loguru import logger
 
+from bot.cache.redis import log_cache_stats, start_invalidation_listener
 from bot.core.config import settings
-from bot.core.loader import tg_bot
+from bot.core.loader import openrouter_client, tg_bot
 from bot.database.database import sessionmaker
-from bot.services.moods import add_default_mood
+from bot.generation.catalog import model_catalog
+from bot.generation.ratelimit import rate_limiter
+from bot.generation.writer import generation_writer
+from bot.services.moods import add_default_mood, start_mood_stats_reconciler
 from bot.tg import dp
 
+invalidation_listener: asyncio.Task | None = None
+mood_stats_reconciler: asyncio.Task | None = None
+
 
 async def on_startup() -> None:
-    global tg_bot_id
+    global tg_bot_id, invalidation_listener, mood_stats_reconciler
     bot_info = await tg_bot.api.get_me()
     tg_bot_id = str(bot_info.unwrap().id)
 
+    await openrouter_client.start()
+    invalidation_listener = start_invalidation_listener()
+    model_catalog.start()
+    generation_writer.start()
+    await rate_limiter.load()
+
     async with sessionmaker() as session:
         result = await add_default_mood(session, int(settings.VK_ADMIN_ID))
 
     if result:
         logger.info("Successfully added the default mood")
 
+    mood_stats_reconciler = start_mood_stats_reconciler(sessionmaker)
+
+
+async def on_shutdown() -> None:
+    await generation_writer.close()
+    await model_catalog.close()
+    await openrouter_client.close()
+    for task in (invalidation_listener, mood_stats_reconciler):
+        if task is not None:
+            task.cancel()
+    log_cache_stats()
+
 
 if __name__ == "__main__":
     tg_bot.loop_wrapper.lifespan.on_startup(on_startup())
+    tg_bot.loop_wrapper.lifespan.on_shutdown(on_shutdown())
     tg_bot.on.load(dp)
 
     tg_bot.run_forever()
\ No newline at end of file
@@ -15,15 +15,15 @@ SETTINGS_KBD = (
 
 
 def mood_page_generator(
-    has_left: bool = False,
-    has_right: bool = False,
-    offset: int = 0
+    before: tuple[int, int] | None = None,
+    after: tuple[int, int] | None = None,
 ) -> InlineKeyboardMarkup:
+    """Arrows to the pages around the (popularity, mood id) cursors, if there are any."""
     keyboard = InlineKeyboard()
 
-    if has_left:
-        keyboard.add(InlineButton("⬅️", callback_data=f"moods/{offset-15}"))
-    if has_right:
-        keyboard.add(InlineButton("➡️", callback_data=f"moods/{offset+15}"))
+    if before is not None:
+        keyboard.add(InlineButton("⬅️", callback_data=f"moods/before/{before[0]}/{before[1]}"))
+    if after is not None:
+        keyboard.add(InlineButton("➡️", callback_data=f"moods/after/{after[0]}/{after[1]}"))
 
     return keyboard.get_markup()
\ No newline at end of file
@@ -13,6 +13,7 @@ from bot.base import UserInfo
 from bot.core.config import settings
 from bot.core.loader import dp
 from bot.tg.keyboards_tg import OPEN_SETTINGS_KBD, SETTINGS_KBD
+from bot.utils import ThrottledEditor
 
 DEFAULT_PREFIX: str = "/"
 tg_bot_id: str = "0"
@@ -53,13 +54,22 @@ async def ai_handler(message: Message, query: str):
     user = UserInfo(message.from_user.id, full_name)
 
     wait_msg = await message.reply(f"{settings.emojis.system} Генерируем ответ, пожалуйста подождите...")
-    msg_reply = await handlers.handle_ai(
-        query, user, tg_bot_id, reply_user, reply_query
-    )
-    if isinstance(wait_msg, MessageCute):
-        await wait_msg.edit(msg_reply)
-    else:
+    if not isinstance(wait_msg, MessageCute):
+        msg_reply = await handlers.handle_ai(
+            query, user, tg_bot_id, "tg", reply_user, reply_query, chat_id=message.chat.id
+        )
         await message.reply(msg_reply)
+        return
+
+    editor = ThrottledEditor(wait_msg.edit, settings.streaming.tg_edit_interval)
+    try:
+        msg_reply = await handlers.handle_ai(
+            query, user, tg_bot_id, "tg", reply_user, reply_query,
+            on_partial=editor.push, chat_id=message.chat.id
+        )
+    finally:
+        await editor.close()
+    await wait_msg.edit(msg_reply)
 
 
 @dp.message(Text(["/settings", "/гптнастройки"]))
@@ -81,7 +91,7 @@ async def settings_callback_handler(cb: CallbackQuery):
 
 @dp.message(Text(["/moods", "/муды"]))
 async def list_mood_handler(message: Message):
-    result = await handlers.handle_mood_page(offset=0, platform="tg")
+    result = await handlers.handle_mood_page(platform="tg")
 
     if isinstance(result, str):
         # No keyboard
@@ -91,9 +101,27 @@ async def list_mood_handler(message: Message):
         await message.answer(result[0], reply_markup=result[1])
 
 
+# "moods/0" opens the first page, it's also what keyboards sent before cursors were added have
 @dp.callback_query(CallbackDataMarkup("moods/<offset:int>"))
-async def list_mood_page_callback_handler(cb: CallbackQuery, offset: int):
-    result = await handlers.handle_mood_page(offset=offset, platform="tg")
+async def list_mood_first_page_callback_handler(cb: CallbackQuery, offset: int):
+    result = await handlers.handle_mood_page(platform="tg")
+
+    if isinstance(result, str):
+        # No keyboard
+        await cb.edit_text(result)
+    else:
+        # Page keyboard
+        await cb.edit_text(result[0], reply_markup=result[1])
+
+
+@dp.callback_query(CallbackDataMarkup("moods/<direction>/<popularity:int>/<mood_id:int>"))
+async def list_mood_page_callback_handler(cb: CallbackQuery, direction: str, popularity: int, mood_id: int):
+    cursor = handlers.parse_mood_cursor((popularity, mood_id))
+    result = await handlers.handle_mood_page(
+        platform="tg",
+        after=cursor if direction == "after" else None,
+        before=cursor if direction == "before" else None,
+    )
 
     if isinstance(result, str):
         # No keyboard
@@ -1,13 +1,16 @@
+import asyncio
 import re
-from typing import Literal, overload
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from loguru import logger
 
-import aiohttp
 from vkbottle.bot import Message
 from vkbottle_types.objects import MessagesMessageAttachmentType, PhotosPhotoSizes
 
 from bot import ai_stuff
-from bot.cache.redis import cached
-from bot.core.config import OPENROUTER_HEADERS, Model, settings
+from bot.core.config import Model, settings
+from bot.generation.catalog import model_catalog
 
 
 def pick_size(sizes: list[PhotosPhotoSizes]) -> str | None:
@@ -68,11 +71,11 @@ async def process_main_prompt(
 async def moderate_query(query: str) -> str | None:
     # We're counting gpt-4o tokens, however, models may be different.
     # Keep that in mind.
-    num_tokens = ai_stuff.num_tokens_from_string(query, "gpt-4o")
-    if num_tokens > 4000:
+    num_tokens = await ai_stuff.count_tokens_over_limit_async(query, 4000, "gpt-4o")
+    if num_tokens is not None:
         return (
             f"{settings.emojis.system} В сообщении более 4000"
-            f" токенов ({num_tokens})! Используйте меньше слов."
+            f" токенов ({num_tokens}+)! Используйте меньше слов."
         )
 
     # Remove links
@@ -88,47 +91,130 @@ def censor_result(query: str) -> str:
     return query
 
 
-def find_model_by_id(models: list[Model], model_id: str) -> Model | None:
-    for model in models:
-        if model.id == model_id:
-            return model
-
-
-@cached(ttl=1800)
-async def get_model_list() -> dict:
-    async with aiohttp.ClientSession(headers=OPENROUTER_HEADERS) as session:
-        async with session.get(settings.OPENAI_BASE_URL+"/models") as request:
-            response = await request.json()
-    return response["data"]
-
-@overload
-async def find_model_by_request(model_string: str, raw: Literal[True]) -> dict | None: ...
-@overload
-async def find_model_by_request(model_string: str, raw: Literal[False]) -> Model | None: ...
-@overload
-async def find_model_by_request(model_string: str) -> Model | None: ...
-
-async def find_model_by_request(model_string: str, raw: bool = False) -> Model | dict | None:
-    models = await get_model_list()
-
-    for model in models:
-        if model["id"] == model_string:
-            if raw:
-                return model
-            new_model = Model(
-                id=model["id"],
-                name=model["id"],
-                display_name=model["name"]
-            )
-            return new_model
+class StreamCensor:
+    """Applies `censor_result` to a stream of deltas.
+
+    The tail of the stream is held back until we know that it can't be a part
+    of a censored word or a link, so the censored stream is the same as
+    censoring the whole response at once.
+    """
+
+    def __init__(self) -> None:
+        self._pending = ""
+        self._holdback = max((len(word) for word in settings.vk_censor_words), default=1) - 1
+
+    def feed(self, delta: str) -> str:
+        """Returns the censored part of the stream that is safe to show."""
+        self._pending += delta
+        return self._drain(final=False)
+
+    def flush(self) -> str:
+        """Returns everything that's left in the buffer."""
+        return self._drain(final=True)
+
+    def _drain(self, final: bool) -> str:
+        text = self._pending
+        cut = len(text)
+        if not final:
+            cut = max(cut - self._holdback, 0)
+            # Don't split a censored word between what we show and what we keep
+            moved = True
+            while moved:
+                moved = False
+                for word in settings.vk_censor_words:
+                    start = text.find(word, max(cut - len(word) + 1, 0))
+                    if start != -1 and start < cut:
+                        cut = start
+                        moved = True
+            # The link regex needs to know what goes after a dot
+            while cut > 0 and text[cut - 1] == ".":
+                cut -= 1
+
+        emit, self._pending = text[:cut], text[cut:]
+        return censor_result(emit)
+
+
+class ThrottledEditor:
+    """Coalesces message edits so that there's at most one edit per `interval` seconds.
+
+    The first text is edited in right away, everything pushed while an edit
+    is in progress or during the cooldown collapses into a single edit.
+    """
+
+    def __init__(self, edit: Callable[[str], Awaitable[Any]], interval: float) -> None:
+        self.edit = edit
+        self.interval = interval
+
+        self._text: str | None = None
+        self._last_text: str | None = None
+        self._event = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._inflight: asyncio.Task | None = None
+
+    def push(self, text: str) -> None:
+        self._text = text
+        self._event.set()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stops editing. An edit that is already being sent is awaited first."""
+        if self._task is None:
+            return
+
+        if self._inflight is not None:
+            try:
+                await asyncio.shield(self._inflight)
+            except Exception:
+                pass
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await self._event.wait()
+            self._event.clear()
+
+            text = self._text
+            if text is not None and text != self._last_text:
+                self._inflight = asyncio.create_task(self._send(text))
+                await self._inflight
+                self._inflight = None
+                self._last_text = text
+
+            await asyncio.sleep(self.interval)
+
+    async def _send(self, text: str) -> None:
+        try:
+            await self.edit(text)
+        except Exception as e:
+            logger.warning(f"Couldn't edit the message: {e}")
+
+
+# Models from the config by id, they don't change while the bot runs
+_models_by_id = {model.id: model for model in settings.models}
+
+
+def find_model_by_id(model_id: str) -> Model | None:
+    return _models_by_id.get(model_id)
+
+
+async def find_model_by_request(model_string: str) -> Model | None:
+    model = await model_catalog.get(model_string)
+    return model.to_model() if model else None
 
 
 async def is_model_free(model_string: str) -> bool | dict | None:
-    model = await find_model_by_request(model_string, raw=True)
+    model = await model_catalog.get(model_string)
     if not model:
         return
 
-    pricing = model.get("pricing")
+    pricing = model.pricing
     if not pricing:
         return
 
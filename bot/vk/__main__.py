@@ -1,19 +1,48 @@
+import asyncio
+
 from loguru import logger
 
+from bot.cache.redis import log_cache_stats, start_invalidation_listener
 from bot.core.config import settings
-from bot.core.loader import vk_bot
+from bot.core.loader import openrouter_client, vk_bot
 from bot.database.database import sessionmaker
-from bot.services.moods import add_default_mood
+from bot.generation.catalog import model_catalog
+from bot.generation.ratelimit import rate_limiter
+from bot.generation.writer import generation_writer
+from bot.services.moods import add_default_mood, start_mood_stats_reconciler
 from bot.vk import labeler
 
+invalidation_listener: asyncio.Task | None = None
+mood_stats_reconciler: asyncio.Task | None = None
+
 
 async def on_startup() -> None:
+    global invalidation_listener, mood_stats_reconciler
+    await openrouter_client.start()
+    invalidation_listener = start_invalidation_listener()
+    model_catalog.start()
+    generation_writer.start()
+    await rate_limiter.load()
+
     async with sessionmaker() as session:
         result = await add_default_mood(session, int(settings.VK_ADMIN_ID))
 
     if result:
         logger.info("Successfully added the default mood")
 
+    mood_stats_reconciler = start_mood_stats_reconciler(sessionmaker)
+
+
+async def on_shutdown() -> None:
+    await generation_writer.close()
+    await model_catalog.close()
+    await openrouter_client.close()
+    for task in (invalidation_listener, mood_stats_reconciler):
+        if task is not None:
+            task.cancel()
+    log_cache_stats()
+
+
 if __name__ == "__main__":
     logger.add(
         "logs/vk_bot.log",
@@ -27,4 +56,5 @@ if __name__ == "__main__":
     vk_bot.labeler.load(labeler)
 
     vk_bot.loop_wrapper.on_startup.append(on_startup())
+    vk_bot.loop_wrapper.on_shutdown.append(on_shutdown())
     vk_bot.run_forever()
\ No newline at end of file
@@ -15,15 +15,15 @@ SETTINGS_KBD = (
 
 
 def mood_page_generator(
-    has_left: bool = False,
-    has_right: bool = False,
-    offset: int = 0
+    before: tuple[int, int] | None = None,
+    after: tuple[int, int] | None = None,
 ) -> str:
+    """Arrows to the pages around the (popularity, mood id) cursors, if there are any."""
     keyboard = Keyboard(inline=True)
 
-    if has_left:
-        keyboard.add(Callback("⬅️", payload={"cmd": "mood_page", "offset": offset-15}))
-    if has_right:
-        keyboard.add(Callback("➡️", payload={"cmd": "mood_page", "offset": offset+15}))
+    if before is not None:
+        keyboard.add(Callback("⬅️", payload={"cmd": "mood_page", "before": list(before)}))
+    if after is not None:
+        keyboard.add(Callback("➡️", payload={"cmd": "mood_page", "after": list(after)}))
 
     return keyboard.get_json()
\ No newline at end of file
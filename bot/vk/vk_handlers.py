@@ -8,6 +8,7 @@ from bot import handlers
 from bot.base import UserInfo
 from bot.core.config import settings
 from bot.core.loader import vk_api
+from bot.utils import ThrottledEditor
 from bot.vk.keyboards_vk import OPEN_SETTINGS_KBD, SETTINGS_KBD
 from bot.vk.vk_middlewares import DonationMsgMiddleware
 
@@ -57,15 +58,24 @@ async def ai_txt_handler(message: VkMessage, query: str):
     wait_msg = await message.reply(
         f"{settings.emojis.system} Генерируем ответ, пожалуйста подождите..."
     )
-    msg_reply = await handlers.handle_ai(
-        query, user_info, settings.VK_GROUP_ID, reply_user_info, reply_query
-    )
-    await vk_api.messages.edit(
-        peer_id=message.peer_id,
-        cmid=wait_msg.conversation_message_id,
-        message=msg_reply,
-        keep_forward_messages=True,
-    )
+
+    async def edit_wait_msg(text: str) -> None:
+        await vk_api.messages.edit(
+            peer_id=message.peer_id,
+            cmid=wait_msg.conversation_message_id,
+            message=text,
+            keep_forward_messages=True,
+        )
+
+    editor = ThrottledEditor(edit_wait_msg, settings.streaming.vk_edit_interval)
+    try:
+        msg_reply = await handlers.handle_ai(
+            query, user_info, settings.VK_GROUP_ID, "vk", reply_user_info, reply_query,
+            on_partial=editor.push, chat_id=message.peer_id
+        )
+    finally:
+        await editor.close()
+    await edit_wait_msg(msg_reply)
 
 
 @labeler.message(text=("!гптнастройки", "!settings", "!настройки"))
@@ -82,7 +92,7 @@ async def open_settings_handler(message: VkMessage):
 @labeler.message(text=("!moods", "!муды"))
 @labeler.message(payload={"cmd": "change_gpt_mood_info"})
 async def list_mood_handler(message: VkMessage):
-    result = await handlers.handle_mood_page(offset=0, platform="vk")
+    result = await handlers.handle_mood_page(platform="vk")
 
     if isinstance(result, str):
         # No keyboard
@@ -101,9 +111,13 @@ async def mood_page_handler(event: MessageEvent):
     payload = event.get_payload_json()
     if payload is None:
         return
-    offset = payload["offset"]
-
-    result = await handlers.handle_mood_page(offset, platform="vk")
+    # Keyboards sent before cursors were added have an offset instead, they open the first page,
+    # and so does anything else that isn't a cursor
+    result = await handlers.handle_mood_page(
+        platform="vk",
+        after=handlers.parse_mood_cursor(payload.get("after")),
+        before=handlers.parse_mood_cursor(payload.get("before")),
+    )
     if isinstance(result, str):
         # No keyboard
         await event.edit_message(result)
@@ -13,7 +13,8 @@ from bot.database.models import Base
 # access to the values within the .ini file in use.
 config = context.config
 
-config.set_main_option("sqlalchemy.url", str(db_url))
+# Tools like bot.database.copy_to_postgres migrate other databases than the configured one
+config.set_main_option("sqlalchemy.url", str(config.attributes.get("database_url", db_url)))
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
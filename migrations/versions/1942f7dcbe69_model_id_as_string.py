@@ -26,7 +26,9 @@ def upgrade() -> None:
         new_column_name='old_current_model_id'
     )
     op.add_column('users', Column("current_model_id", String(), default="18"))
-    op.execute("UPDATE users SET current_model_id = CAST(old_current_model_id as STRING)")
+    # SQLite databases were migrated with STRING (NUMERIC affinity), PostgreSQL has no STRING
+    string_type = "STRING" if op.get_bind().dialect.name == "sqlite" else "VARCHAR"
+    op.execute(f"UPDATE users SET current_model_id = CAST(old_current_model_id as {string_type})")
     op.drop_column("users", "old_current_model_id")
     # ### end Alembic commands ###
 
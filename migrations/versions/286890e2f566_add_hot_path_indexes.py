@@ -0,0 +1,36 @@
+"""add hot path indexes
+
+Revision ID: 286890e2f566
+Revises: 6d326f6afa01
+Create Date: 2026-10-18 12:14:07.512394
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '286890e2f566'
+down_revision: Union[str, Sequence[str], None] = '6d326f6afa01'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Generations are only counted, so the indexes include the id and the table itself isn't read
+    # (SQLite ignores postgresql_include, its indexes carry the rowid anyway)
+    op.create_index('ix_generations_mood_id', 'generations', ['mood_id'], postgresql_include=['id'])
+    op.create_index('ix_generations_user_id_model', 'generations', ['user_id', 'model'], postgresql_include=['id'])
+    op.create_index('ix_generations_model', 'generations', ['model'], postgresql_include=['id'])
+    op.create_index('ix_moods_user_id_is_private', 'moods', ['user_id', 'is_private'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_moods_user_id_is_private', table_name='moods')
+    op.drop_index('ix_generations_model', table_name='generations')
+    op.drop_index('ix_generations_user_id_model', table_name='generations')
+    op.drop_index('ix_generations_mood_id', table_name='generations')
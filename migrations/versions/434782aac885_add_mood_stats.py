@@ -0,0 +1,43 @@
+"""add mood stats
+
+Revision ID: 434782aac885
+Revises: 286890e2f566
+Create Date: 2026-10-18 15:03:51.208716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '434782aac885'
+down_revision: Union[str, Sequence[str], None] = '286890e2f566'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('mood_stats',
+    sa.Column('mood_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('generations', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.ForeignKeyConstraint(['mood_id'], ['moods.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('mood_id')
+    )
+    op.create_index('ix_mood_stats_generations', 'mood_stats', ['generations', 'mood_id'])
+
+    # Counts of the generations made so far
+    op.execute(
+        "INSERT INTO mood_stats (mood_id, generations)"
+        " SELECT moods.id, COUNT(generations.id) FROM moods"
+        " LEFT JOIN generations ON generations.mood_id = moods.id"
+        " GROUP BY moods.id"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_mood_stats_generations', table_name='mood_stats')
+    op.drop_table('mood_stats')
@@ -0,0 +1,61 @@
+"""add generation usage
+
+Revision ID: 959cca229dff
+Revises: 434782aac885
+Create Date: 2026-10-18 15:05:07.572849
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '959cca229dff'
+down_revision: Union[str, Sequence[str], None] = '434782aac885'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('usage_daily',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('model', sa.String(), nullable=False),
+    sa.Column('mood_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('generations', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('metered', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('prompt_tokens', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+    sa.Column('completion_tokens', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+    sa.Column('cost', sa.Double(), server_default=sa.text('0'), nullable=False),
+    sa.Column('latency_ms', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+    sa.Column('ttft_ms', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'model', 'mood_id')
+    )
+    op.add_column('generations', sa.Column('prompt_tokens', sa.Integer(), nullable=True))
+    op.add_column('generations', sa.Column('completion_tokens', sa.Integer(), nullable=True))
+    op.add_column('generations', sa.Column('latency_ms', sa.Integer(), nullable=True))
+    op.add_column('generations', sa.Column('ttft_ms', sa.Integer(), nullable=True))
+    op.add_column('generations', sa.Column('provider', sa.String(), nullable=True))
+    op.add_column('generations', sa.Column('cost', sa.Double(), nullable=True))
+
+    # Past generations only have counts, they were saved without usage.
+    # Those of deleted moods are left out, the key needs a mood
+    op.execute(
+        "INSERT INTO usage_daily (day, model, mood_id, generations)"
+        " SELECT DATE(created_at), model, mood_id, COUNT(*) FROM generations"
+        " WHERE mood_id IS NOT NULL"
+        " GROUP BY DATE(created_at), model, mood_id"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('generations', 'cost')
+    op.drop_column('generations', 'provider')
+    op.drop_column('generations', 'ttft_ms')
+    op.drop_column('generations', 'latency_ms')
+    op.drop_column('generations', 'completion_tokens')
+    op.drop_column('generations', 'prompt_tokens')
+    op.drop_table('usage_daily')
@@ -0,0 +1,30 @@
+"""add lost hedged requests
+
+Revision ID: a524fae5055d
+Revises: 959cca229dff
+Create Date: 2026-10-18 15:52:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a524fae5055d'
+down_revision: Union[str, Sequence[str], None] = '959cca229dff'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('usage_daily', sa.Column('lost', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.add_column('usage_daily', sa.Column('lost_cost', sa.Double(), server_default=sa.text('0'), nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('usage_daily', 'lost_cost')
+    op.drop_column('usage_daily', 'lost')